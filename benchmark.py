@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+import main
+
+# resource is not available on Windows, peak RSS is then not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Text files bundled with the project
+CORPORA = ['iliad.txt', 'crime.txt', 'syndaflod.txt']
+# Functions timed by the benchmark suite
+SUITE_FUNCTIONS = [
+    'get_basic_statistics', 'word_analysis', 'sentence_analysis',
+    'character_analysis', 'calculate_lix', 'export_statistics'
+]
+# Sizes of the synthetic corpora in MB
+SYNTHETIC_SIZES = [100, 1024]
+# Synthetic corpora are analysed in streaming mode so memory use stays
+# bounded on GB sized files
+SYNTHETIC_OPTIONS = {'streaming': True}
+# Where synthetic corpora are written, they are reused by later runs
+DATA_DIR = os.path.join(tempfile.gettempdir(), 'text_analysis_benchmark')
+
+
+# The tokenizer word_analysis used before main.tokenize, kept to compare
+# against: builds each line one character at a time
+def legacy_tokenize(text):
+    words = []
+    for line in text.split('\n'):
+        line = line.strip().lower()
+        clean_text = ''
+        for char in line:
+            if char.isalpha() or char.isspace():
+                clean_text += char
+            else:
+                clean_text += ''
+        words.extend(clean_text.split())
+    return words
+
+
+# Fastest time of running function(text) repeat times
+def best_time(function, text, repeat):
+    best = None
+    for i in range(0, repeat, 1):
+        start = time.perf_counter()
+        function(text)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# Micro-benchmark of the tokenizer: tokens per second before and after
+def benchmark_tokenizer(files, repeat=3):
+    print(
+        f'{"File":<16}{"Tokens":>10}{"Before (tok/s)":>18}'
+        f'{"After (tok/s)":>18}{"Speedup":>10}'
+    )
+    for file in files:
+        with open(file, 'r', encoding='utf-8') as file_stream:
+            text = file_stream.read()
+
+        words = main.tokenize(text)
+        if words != legacy_tokenize(text):
+            print(f'{file}: tokenizers give different words!')
+            continue
+
+        before = best_time(legacy_tokenize, text, repeat)
+        after = best_time(main.tokenize, text, repeat)
+        print(
+            f'{os.path.basename(file):<16}{len(words):>10}'
+            f'{len(words) / before:>18.0f}{len(words) / after:>18.0f}'
+            f'{before / after:>9.1f}x'
+        )
+
+
+# Bundled corpora as full paths
+def get_bundled_corpora():
+    directory = os.path.dirname(os.path.abspath(__file__))
+    files = []
+    for name in CORPORA:
+        files.append(os.path.join(directory, name))
+    return files
+
+
+# Write a synthetic corpus of at least size_mb MB by repeating the bundled
+# corpora, or reuse one written by an earlier run
+def make_synthetic_corpus(size_mb, data_dir=DATA_DIR):
+    file = os.path.join(data_dir, f'synthetic_{size_mb}mb.txt')
+    size = size_mb * 1024 * 1024
+    if os.path.exists(file) and os.path.getsize(file) >= size:
+        return file
+
+    os.makedirs(data_dir, exist_ok=True)
+    sources = []
+    for source in get_bundled_corpora():
+        with open(source, 'rb') as file_stream:
+            data = file_stream.read()
+        if not data.endswith(b'\n'):
+            data += b'\n'
+        sources.append(data)
+
+    print(f'Writing {file}...', file=sys.stderr)
+    written = 0
+    with open(file + '.tmp', 'wb') as file_stream:
+        while written < size:
+            for data in sources:
+                file_stream.write(data)
+                written += len(data)
+    os.replace(file + '.tmp', file)
+    return file
+
+
+# Highest resident set size of this process in MB, None if unknown
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+# Call one of the suite functions on a file without using earlier results.
+# export_statistics always uses the analysis cache, so it gets an empty one
+# and writes its report to a temporary directory
+def run_function(function_name, file, workers, options):
+    if function_name != 'export_statistics':
+        getattr(main, function_name)(
+            file, use_cache=False, workers=workers, options=options
+        )
+        return
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        main.CACHE_DIR = os.path.join(directory, 'cache')
+        os.chdir(directory)
+        try:
+            state = {'workers': workers, 'options': options}
+            main.export_statistics(file, json_export=True, state=state)
+        finally:
+            os.chdir(cwd)
+
+
+# Measure one function on one file: fastest time of repeat runs and, in an
+# extra run, the peak memory traced by tracemalloc. Run in its own process by
+# the suite so the peak RSS belongs to this case only
+def measure_case(function_name, file, repeat, workers, options, trace=True):
+    best = None
+    for i in range(0, repeat, 1):
+        start = time.perf_counter()
+        run_function(function_name, file, workers, options)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    peak_traced_mb = None
+    if trace:
+        tracemalloc.start()
+        run_function(function_name, file, workers, options)
+        peak_traced_mb = round(
+            tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1
+        )
+        tracemalloc.stop()
+
+    case = {}
+    case['seconds'] = round(best, 4)
+    case['peak_traced_mb'] = peak_traced_mb
+    case['peak_rss_mb'] = get_peak_rss_mb()
+    return case
+
+
+# Run the benchmark suite: every function on the bundled corpora and the
+# synthetic corpora. Returns the results as a dictionary that can be saved
+# as JSON and compared with compare_results
+def run_suite(
+    functions=SUITE_FUNCTIONS, sizes=SYNTHETIC_SIZES, repeat=3, workers=1,
+    trace=True, data_dir=DATA_DIR
+):
+    corpora = []
+    for file in get_bundled_corpora():
+        corpora.append((file, {}))
+    for size_mb in sizes:
+        corpora.append(
+            (make_synthetic_corpus(size_mb, data_dir), SYNTHETIC_OPTIONS)
+        )
+
+    results = {}
+    results['python'] = platform.python_version()
+    results['platform'] = platform.platform()
+    results['date'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    results['repeat'] = repeat
+    results['workers'] = workers
+    results['cases'] = []
+
+    for file, options in corpora:
+        size = os.path.getsize(file)
+        tokens = main.get_basic_statistics(
+            file, use_cache=False, workers=max(workers, 1), options=options
+        )['total_words']
+        for function_name in functions:
+            print(
+                f'{function_name} on {os.path.basename(file)}...',
+                file=sys.stderr
+            )
+            # A new process for every case, so the memory of earlier cases
+            # doesn't count
+            command = [
+                sys.executable, os.path.abspath(__file__), 'case',
+                function_name, file, '--repeat', str(repeat),
+                '--workers', str(workers), '--options', json.dumps(options)
+            ]
+            if not trace:
+                command.append('--no-tracemalloc')
+            process = subprocess.run(
+                command, capture_output=True, text=True, check=True
+            )
+            case = json.loads(process.stdout.splitlines()[-1])
+
+            case['function'] = function_name
+            case['corpus'] = os.path.basename(file)
+            case['options'] = options
+            case['bytes'] = size
+            case['tokens'] = tokens
+            case['mb_per_s'] = round(size / 1024 / 1024 / case['seconds'], 2)
+            case['tokens_per_s'] = round(tokens / case['seconds'])
+            results['cases'].append(case)
+    return results
+
+
+def print_results(results):
+    print(
+        f'{"Function":<22}{"Corpus":<22}{"MB/s":>9}{"Tokens/s":>12}'
+        f'{"Traced (MB)":>13}{"RSS (MB)":>10}'
+    )
+    for case in results['cases']:
+        print(
+            f'{case["function"]:<22}{case["corpus"]:<22}'
+            f'{case["mb_per_s"]:>9}{case["tokens_per_s"]:>12}'
+            f'{str(case["peak_traced_mb"]):>13}'
+            f'{str(case["peak_rss_mb"]):>10}'
+        )
+
+
+# Compare results with a baseline. A case regressed if its throughput is
+# more than threshold (0.1 = 10%) lower or its traced peak memory more than
+# threshold higher than in the baseline. Returns the regressions
+def compare_results(results, baseline, threshold=0.1):
+    baseline_cases = {}
+    for case in baseline['cases']:
+        baseline_cases[(case['function'], case['corpus'])] = case
+
+    regressions = []
+    for case in results['cases']:
+        old_case = baseline_cases.get((case['function'], case['corpus']))
+        if old_case is None:
+            continue
+        name = f'{case["function"]} on {case["corpus"]}'
+        if case['mb_per_s'] < old_case['mb_per_s'] * (1 - threshold):
+            regressions.append(
+                f'{name}: {case["mb_per_s"]} MB/s, baseline '
+                f'{old_case["mb_per_s"]} MB/s'
+            )
+        if (
+            case['peak_traced_mb'] is not None
+            and old_case['peak_traced_mb'] is not None
+            and case['peak_traced_mb']
+            > old_case['peak_traced_mb'] * (1 + threshold)
+        ):
+            regressions.append(
+                f'{name}: {case["peak_traced_mb"]} MB traced, baseline '
+                f'{old_case["peak_traced_mb"]} MB'
+            )
+    return regressions
+
+
+def parse_sizes(text):
+    sizes = []
+    for size in text.split(','):
+        if size.strip() != '':
+            sizes.append(int(size))
+    return sizes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of the text analysis tool.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    tokenizer_parser = commands.add_parser(
+        'tokenizer', help='tokens/s of the old and new tokenizer'
+    )
+    tokenizer_parser.add_argument(
+        'files', nargs='*', help='text files (default: bundled corpora)'
+    )
+
+    suite_parser = commands.add_parser(
+        'suite', help='time the analyses on bundled and synthetic corpora'
+    )
+    suite_parser.add_argument(
+        '--functions', default=','.join(SUITE_FUNCTIONS),
+        help='comma separated functions to time (default: all)'
+    )
+    suite_parser.add_argument(
+        '--sizes', default=','.join(map(str, SYNTHETIC_SIZES)),
+        help='comma separated sizes of synthetic corpora in MB, empty for '
+        'none (default: 100,1024)'
+    )
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--workers', type=int, default=1)
+    suite_parser.add_argument(
+        '--no-tracemalloc', action='store_true',
+        help="don't measure traced peak memory (saves one run per case)"
+    )
+    suite_parser.add_argument('--data-dir', default=DATA_DIR)
+    suite_parser.add_argument(
+        '-o', '--output', help='save the results as JSON to this file'
+    )
+    suite_parser.add_argument(
+        '--baseline', help='compare with results saved by an earlier run'
+    )
+    suite_parser.add_argument(
+        '--threshold', type=float, default=0.1,
+        help='allowed slowdown or memory growth (default: 0.1 = 10%%)'
+    )
+
+    # Used by the suite to run a single case in a new process
+    case_parser = commands.add_parser('case')
+    case_parser.add_argument('function', choices=SUITE_FUNCTIONS)
+    case_parser.add_argument('file')
+    case_parser.add_argument('--repeat', type=int, default=3)
+    case_parser.add_argument('--workers', type=int, default=1)
+    case_parser.add_argument('--options', default='{}')
+    case_parser.add_argument('--no-tracemalloc', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'tokenizer':
+        files = args.files
+        if len(files) == 0:
+            files = get_bundled_corpora()
+        benchmark_tokenizer(files)
+
+    elif args.command == 'case':
+        # Messages of the analysis go to stderr, the result is the last line
+        # of stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            case = measure_case(
+                args.function, args.file, args.repeat, args.workers,
+                json.loads(args.options), not args.no_tracemalloc
+            )
+        print(json.dumps(case))
+
+    elif args.command == 'suite':
+        results = run_suite(
+            args.functions.split(','), parse_sizes(args.sizes), args.repeat,
+            args.workers, not args.no_tracemalloc, args.data_dir
+        )
+        print_results(results)
+        if args.output is not None:
+            with open(args.output, 'w', encoding='utf-8') as file_stream:
+                json.dump(results, file_stream, indent=4)
+
+        if args.baseline is not None:
+            with open(args.baseline, 'r', encoding='utf-8') as file_stream:
+                baseline = json.load(file_stream)
+            regressions = compare_results(results, baseline, args.threshold)
+            if len(regressions) != 0:
+                print('\nRegressions:')
+                for regression in regressions:
+                    print(regression)
+                sys.exit(1)
+            print('\nNo regressions.')
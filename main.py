@@ -1,6 +1,36 @@
 import os
-import matplotlib.pyplot as plt
+import sys
 import json
+import hashlib
+import pickle
+import io
+import mmap
+import re
+import codecs
+import struct
+import array
+import heapq
+import math
+import time
+import argparse
+import contextlib
+import glob
+import itertools
+from collections import Counter
+
+# resource is not available on Windows, peak memory is then not profiled
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Slow imports (matplotlib, numpy, the process pool) are done the first time
+# they are needed, so scripts that only print or export results start fast
+
+# NumPy is only used to speed up character counting of large blocks. False
+# until load_numpy() has tried to import it, None if it is not installed
+numpy = False
+NUMPY_MIN_SIZE = 64 * 1024
 
 
 # Clear terminal
@@ -22,9 +52,14 @@ def get_file():
         txt_files = []
 
         # Print .txt files and filesize from current directory
-        print('Files in current directory (.txt): ')
+        print(
+            f'Files in current directory (.txt, compressed .txt.gz, .txt.bz2 '
+            f'or .txt.xz, {BINARY_EXTENSION} exported results): '
+        )
         for i in range(0, len(files), 1):
-            if files[i].endswith('.txt'):
+            if files[i].endswith(TEXT_EXTENSIONS) or files[i].endswith(
+                BINARY_EXTENSION
+            ):
                 txt_files.append(files[i])
         if len(txt_files) != 0:
             for i in range(0, len(txt_files), 1):
@@ -42,8 +77,11 @@ def get_file():
         file_path = cwd + '/' + user_input
         if os.path.exists(file_path) and user_input != '':
             return file_path
-        if os.path.exists(file_path + '.txt'):
-            return file_path + '.txt'
+        for extension in TEXT_EXTENSIONS:
+            if os.path.exists(file_path + extension):
+                return file_path + extension
+        if os.path.exists(file_path + BINARY_EXTENSION):
+            return file_path + BINARY_EXTENSION
         elif user_input.lower() != 'x':
             # Ask user for valid filename after file is not found
             print('Please enter a valid filename from the current directory')
@@ -51,522 +89,3274 @@ def get_file():
     return None  # Return None if selection was cancelled
 
 
-# Basic statistics: bar chart of text composition and pie chart of
-# character types
-# Total number of lines
-# Total number of words
-# Total number of characters (with and without spaces)
-# Average words per line
-# Average characters per word
-def get_basic_statistics(file):
-    line_counter = 0
-    statistics = {}
-    statistics['total_words'] = 0
-    statistics['total_lines'] = 0
-    statistics['total_characters'] = 0
-    statistics['total_characters_no_spaces'] = 0
-    statistics['avg_words_per_line'] = 0
-    statistics['avg_characters_per_word'] = 0
+# Amount of bytes the analysis engine reads from the file at a time
+READ_SIZE = 1024 * 1024
+# Compressed files are decompressed while they are read. A reader thread
+# decompresses up to COMPRESSED_QUEUE_SIZE windows of READ_SIZE bytes ahead
+# of the analysis; zlib, bz2 and lzma don't hold the GIL while they
+# decompress, so the next window is decompressed while the analysis works
+# on the last one. Offsets in compressed files are offsets in the
+# decompressed text
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz')
+COMPRESSED_QUEUE_SIZE = 4
+# Text files that are analysed, plain or compressed
+TEXT_EXTENSIONS = ('.txt', '.txt.gz', '.txt.bz2', '.txt.xz')
+# Files smaller than this are always analysed in a single process
+PARALLEL_MIN_SIZE = 4 * 1024 * 1024
+# How far past a chunk edge to look for a line that ends a sentence
+CHUNK_SEARCH_SIZE = 64 * 1024
+
+
+# Single-pass analysis engine
+# Reads the file once and fills the basic statistics, word analysis, sentence
+# analysis, character analysis and LIX score at the same time.
+# The analysis functions below are views over the results of this engine.
+# With workers > 1 large files are split into chunks that are analysed in
+# separate processes and merged afterwards.
+# options is a dictionary of analysis options:
+# streaming: keep length distributions as histograms and only the longest
+#   and shortest sentence instead of one entry per word and sentence, so
+#   memory use doesn't grow with the size of the file
+# top_words: amount of most common words to list (10 by default)
+# top_letters: amount of most common letters to list (12 by default)
+# approximate_top_words: count at most about this many different words
+#   instead of the whole vocabulary. The most common words are then
+#   estimates that are at most top_words_max_error too low
+# hyperloglog_precision: estimate the amount of unique words with a
+#   HyperLogLog sketch of 2 ** precision bytes (4 to 16, 12 is 4 KB with a
+#   standard error of 1.6%) instead of counting them. The vocabulary is then
+#   not kept, so the most common words are approximate too
+#   (HYPERLOGLOG_TOP_WORDS_CAPACITY unless approximate_top_words is given)
+# ngram_size: also count the most common runs of this many words, see
+#   new_ngram_analysis
+# top_ngrams: amount of most common n-grams to list (10 by default)
+# ngram_capacity: count at most about this many different n-grams
+#   (NGRAM_CAPACITY by default)
+# ngram_stopwords: leave out n-grams containing a stopword, True for the
+#   English STOPWORDS or a tuple of lowercase stopwords
+# readability_unit, readability_window: also make a readability profile
+#   with windows of this many words or sentences, or per chapter, see
+#   new_readability_analysis
+# chapter_pattern: regular expression of chapter headings for the
+#   readability profile (CHAPTER_PATTERN by default)
+# encoding: decode the file with this encoding instead of detecting it
+# encoding_errors: replace (default), skip or strict, see new_decoding
+def analyse_file(file, workers=1, options=None):
+    return finish_analysis(
+        analyse_file_part(file, 0, None, workers, options)
+    )
+
+
+# Analyse a file that may have grown since it was last analysed. resume_point
+# is the second value returned by a previous call: only bytes after its
+# offset are read if the start of the file is unchanged, otherwise the whole
+# file is analysed again. Returns the results and a new resume point
+def analyse_file_incremental(
+    file, workers=1, resume_point=None, options=None
+):
+    # Appending to a compressed file changes its compressed bytes, so it is
+    # always analysed again
+    if get_compression(file) is not None:
+        return analyse_file(file, workers, options), None
+
+    # Lines after the last newline may still grow, so the resume point is
+    # always placed right after it
+    end = find_last_line_end(file)
+    analysis = None
+    start = 0
+    prefix_hash = new_prefix_hash()
+    if resume_point is not None and resume_point['offset'] <= end:
+        update_prefix_hash(prefix_hash, file, 0, resume_point['offset'])
+        if prefix_hash.hexdigest() == resume_point['checksum']:
+            analysis = pickle.loads(resume_point['analysis'])
+            start = resume_point['offset']
+            # Only profile this run
+            analysis['profile'] = None
+            if PROFILE:
+                analysis['profile'] = {}
+        else:
+            prefix_hash = new_prefix_hash()
+
+    if analysis is None:
+        analysis = analyse_file_part(file, 0, end, workers, options)
+    else:
+        merge_analysis(
+            analysis, analyse_file_part(file, start, end, workers, options)
+        )
+
+    resume_point = {}
+    resume_point['offset'] = end
+    # The hash of the unchanged start goes on with the new bytes only
+    update_prefix_hash(prefix_hash, file, start, end)
+    resume_point['checksum'] = prefix_hash.hexdigest()
+    profile = analysis['profile']
+    analysis['profile'] = None
+    resume_point['analysis'] = pickle.dumps(
+        analysis, pickle.HIGHEST_PROTOCOL
+    )
+    analysis['profile'] = profile
+
+    # Add the unfinished last line
+    merge_analysis(analysis, analyse_file_range(file, end, None, options))
+    # The token stream is only kept for the encoding that is detected
+    if analysis['tokens'] is not None and (
+        options is None
+        or options.get('encoding') is None
+        and options.get('encoding_errors') is None
+    ):
+        save_token_stream(file, analysis['vocabulary'], analysis['tokens'])
+    return finish_analysis(analysis), resume_point
+
+
+# Analyse the bytes from start to end of a file (the rest of the file if end
+# is None), in parallel if the part is large enough
+def analyse_file_part(file, start=0, end=None, workers=1, options=None):
+    # Compressed files can only be read from the start
+    if get_compression(file) is not None:
+        workers = 1
+    if workers > 1 and os.path.isfile(file):
+        if end is None:
+            end = os.path.getsize(file)
+        if end - start >= PARALLEL_MIN_SIZE:
+            return analyse_file_parallel(file, workers, start, end, options)
+    return analyse_file_range(file, start, end, options)
+
+
+# Byte offset right after the last newline of a file (0 if there is none)
+def find_last_line_end(file):
+    with open(file, 'rb') as file_stream:
+        position = file_stream.seek(0, os.SEEK_END)
+        while position > 0:
+            read_size = min(CHUNK_SEARCH_SIZE, position)
+            position -= read_size
+            file_stream.seek(position)
+            newline = file_stream.read(read_size).rfind(b'\n')
+            if newline != -1:
+                return position + newline + 1
+    return 0
+
+
+# Hash of the start of a file, used to check that a file was only appended
+# to since it was last analysed. Every byte is hashed, unlike the sampled
+# hash of file_fingerprint, so edits anywhere in the start are noticed
+def new_prefix_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+# Add the bytes from start to end of a file to a prefix hash
+def update_prefix_hash(prefix_hash, file, start, end):
+    with open(file, 'rb') as file_stream:
+        file_stream.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = file_stream.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            prefix_hash.update(data)
+            remaining -= len(data)
+    return prefix_hash
+
+
+# Analyse the bytes from start to end of a file (the rest of the file if end
+# is None). Returns the unfinished analysis so chunks can be merged
+def analyse_file_range(file, start=0, end=None, options=None):
+    # A chunk that doesn't start the file may start in the middle of a
+    # sentence
+    analysis = new_analysis(options, starts_mid_sentence=start != 0)
+    profile = analysis['profile']
 
-    # Go through file line-by-line and save basic statistics in dictionary
     try:
-        with open(file, 'r', encoding='utf-8') as file_stream:
-            line = file_stream.readline()  # Read first line of the file
-            while line != '':
-                # Create separate variable without newline and blankspace
-                line_filtered = line.strip()
-                line_counter += 1
-
-                statistics['total_words'] += len(line.split())
-                statistics['total_characters'] += len(line)
-                line_filtered = line_filtered.replace(' ', '')
-                statistics['total_characters_no_spaces'] += len(line_filtered)
-
-                line = file_stream.readline()
+        carry = ''
+        for text in read_text_blocks(
+            file, start, end, profile, analysis['decoding']
+        ):
+            started = time.perf_counter()
+            count_characters(analysis, text)
+            if profile is not None:
+                add_to_profile(profile, 'characters', started)
+            # Only whole lines are analysed, the rest is carried over to
+            # the next block
+            text = carry + text
+            line_end = text.rfind('\n') + 1
+            carry = text[line_end:]
+            if line_end != 0:
+                update_analysis(analysis, text[:line_end])
+        if carry != '':
+            update_analysis(analysis, carry)
     except Exception as e:
         print(f'Unknown error reading file: {e}')
+        analysis['error'] = str(e)
 
-    if line_counter != 0:
-        statistics['total_lines'] = line_counter
-        statistics['avg_words_per_line'] = round(
-            statistics['total_words'] / statistics['total_lines'], 3
+    return analysis
+
+
+# Read the bytes from start to end of a file and yield them as decoded text
+# blocks. Newlines are translated like when the file is opened in text mode
+# and characters split between two windows are decoded correctly: the
+# incremental decoder keeps the first bytes of a multi-byte UTF-8 character
+# until the rest arrives with the next window.
+# decoding is the state of new_decoding, the encoding is detected when it is
+# None. ASCII and single-byte encoded text has no characters split between
+# windows, so each window is decoded on its own without the incremental
+# decoder. A file detected as ASCII is decoded as UTF-8 from the first window
+# that isn't ASCII.
+# Reading and decoding are profiled as one stage: the bytes of a mapped file
+# are only read from disk when the decoder first touches them
+def read_text_blocks(file, start=0, end=None, profile=None, decoding=None):
+    if decoding is None:
+        decoding = new_decoding()
+    if decoding['encoding'] is None:
+        decoding['encoding'] = detect_encoding(file)
+    # Undecodable bytes are decoded as lone surrogates and replaced after
+    # they are counted
+    errors = 'surrogateescape'
+    if decoding['errors'] == 'strict':
+        errors = 'strict'
+    decoder = None
+    if not decoding['detected'] or decoding['encoding'] not in (
+        'ascii', SINGLE_BYTE_ENCODING
+    ):
+        decoder = codecs.getincrementaldecoder(decoding['encoding'])(errors)
+    newline_decoder = io.IncrementalNewlineDecoder(None, translate=True)
+
+    started = time.perf_counter()
+    for window in read_byte_windows(file, start, end):
+        if decoder is not None:
+            text = decoder.decode(window)
+        elif decoding['encoding'] == 'ascii':
+            try:
+                text = str(window, 'ascii')
+            except UnicodeDecodeError:
+                decoding['encoding'] = 'utf-8'
+                decoder = codecs.getincrementaldecoder('utf-8')(errors)
+                text = decoder.decode(window)
+        else:
+            text = str(window, decoding['encoding'], errors)
+        text = newline_decoder.decode(text)
+        if errors != 'strict' and not text.isascii():
+            text = replace_undecodable(text, decoding)
+        if profile is not None:
+            add_to_profile(
+                profile, 'read_decode', started, bytes_read=len(window)
+            )
+        if text != '':
+            yield text
+        started = time.perf_counter()
+    text = ''
+    if decoder is not None:
+        text = decoder.decode(b'', final=True)
+    text = newline_decoder.decode(text, final=True)
+    if errors != 'strict' and not text.isascii():
+        text = replace_undecodable(text, decoding)
+    if text != '':
+        yield text
+
+
+# Decoding of files. The encoding is detected from samples of the file
+# unless the encoding option is given:
+# ascii: every sample is ASCII
+# utf-8: the samples are valid UTF-8
+# SINGLE_BYTE_ENCODING: otherwise, the file is taken to be single-byte
+#   encoded text like most older Western European files
+# encoding_errors is what is done with bytes that can't be decoded: replace
+# them with U+FFFD (the default), skip them or stop the analysis with an
+# error (strict). Replaced and skipped bytes are counted
+ENCODING_ERRORS = ('replace', 'skip', 'strict')
+SINGLE_BYTE_ENCODING = 'cp1252'
+# Bytes sampled at the start, middle and end of a file to detect encoding
+ENCODING_SAMPLE_SIZE = 64 * 1024
+# Lone surrogates that undecodable bytes are decoded as, with what replaces
+# them
+UNDECODABLE_PATTERN = re.compile('[\udc80-\udcff]')
+UNDECODABLE_REPLACEMENTS = {
+    'replace': dict.fromkeys(range(0xdc80, 0xdd00), '\ufffd'),
+    'skip': dict.fromkeys(range(0xdc80, 0xdd00), None)
+}
+
+
+# Decoding state of an analysis, filled in by read_text_blocks
+def new_decoding(options=None):
+    options = options or {}
+    decoding = {}
+    decoding['encoding'] = options.get('encoding')
+    decoding['detected'] = decoding['encoding'] is None
+    decoding['errors'] = options.get('encoding_errors', 'replace')
+    if decoding['errors'] not in ENCODING_ERRORS:
+        raise ValueError(
+            f'Unknown encoding error handling {decoding["errors"]}, use one '
+            f'of {", ".join(ENCODING_ERRORS)}'
         )
-        statistics['avg_characters_per_word'] = round(
-            statistics['total_characters_no_spaces'] /
-            statistics['total_words'],
-            3
+    decoding['undecodable_bytes'] = 0
+    return decoding
+
+
+# Detect the encoding of a file from samples of its start, middle and end
+# (only the start of compressed files)
+def detect_encoding(file):
+    samples = []
+    with open_binary(file) as file_stream:
+        if get_compression(file) is not None:
+            samples.append(file_stream.read(ENCODING_SAMPLE_SIZE))
+        else:
+            size = os.fstat(file_stream.fileno()).st_size
+            for offset in sorted(set((
+                0,
+                max((size - ENCODING_SAMPLE_SIZE) // 2, 0),
+                max(size - ENCODING_SAMPLE_SIZE, 0)
+            ))):
+                file_stream.seek(offset)
+                samples.append(file_stream.read(ENCODING_SAMPLE_SIZE))
+
+    # UTF-8 unless fewer characters of the samples are valid multi-byte
+    # characters than there are undecodable bytes. Single-byte encoded text
+    # hardly ever has byte sequences that are valid UTF-8
+    encoding = 'ascii'
+    valid = 0
+    undecodable = 0
+    for i in range(0, len(samples), 1):
+        if samples[i].isascii():
+            continue
+        encoding = 'utf-8'
+        sample = samples[i]
+        # A sample may start or end in the middle of a character
+        if i != 0:
+            sample = sample.lstrip(bytes(range(0x80, 0xc0)))
+        text = codecs.getincrementaldecoder('utf-8')(
+            'surrogateescape'
+        ).decode(sample)
+        sample_undecodable = len(UNDECODABLE_PATTERN.findall(text))
+        undecodable += sample_undecodable
+        valid += len(text) - len(sample.decode('ascii', 'ignore')) - (
+            sample_undecodable
         )
-    else:
-        print('File was empty.')
-    return statistics
+    if undecodable > valid:
+        return SINGLE_BYTE_ENCODING
+    return encoding
 
 
-# Word analysis: bar chart of most common words and histogram of word lengths
-# Most common words (top 10)
-# • Word length distribution
-# • Unique word count
-# • Words appearing only once
-def word_analysis(file):
-    unique_words = set()
-    word_lengths_unique = []
-    word_lengths_duplicates = []
-    unique_words_count = 0
-    common_words = {}
-    words_above_6_chars = 0
+# Count the undecodable bytes of decoded text and replace or remove them
+def replace_undecodable(text, decoding):
+    undecodable = len(UNDECODABLE_PATTERN.findall(text))
+    if undecodable == 0:
+        return text
+    decoding['undecodable_bytes'] += undecodable
+    return text.translate(UNDECODABLE_REPLACEMENTS[decoding['errors']])
 
-    try:
-        with open(file, 'r', encoding='utf-8') as file_stream:
-            line = file_stream.readline()  # Read first line of the file
-            while line != '':
-                # Remove newlines/blankspaces and make it lowercase
-                line = line.strip().lower()
-                clean_text = ''
-
-                # Clean text by only including words (no digits etc)
-                for word in line:
-                    if word.isalpha() or word.isspace():
-                        clean_text += word
-                    else:
-                        clean_text += ''
 
-                line_filtered = clean_text.split()
+# Merge the decoding of the chunk that directly follows. A file detected as
+# ASCII is UTF-8 if any chunk wasn't ASCII
+def merge_decoding(decoding, other):
+    if decoding['encoding'] in (None, 'ascii'):
+        decoding['encoding'] = other['encoding']
+    decoding['undecodable_bytes'] += other['undecodable_bytes']
 
-                for word in line_filtered:
-                    unique_words.add(word.capitalize())
-                    word_lengths_duplicates.append(len(word))
-                    # Count words above 6 chars (for LIX score)
-                    if len(word) > 6:
-                        words_above_6_chars += 1
 
-                    # Count how many times each word duplicates and save
-                    # it in common_words
-                    if word.capitalize() in common_words:
-                        common_words[word.capitalize()] += 1
+# Yield the bytes from start to end of a file in windows of READ_SIZE bytes.
+# The file is memory-mapped and the windows are memoryviews of the mapping,
+# so the bytes are only copied once, by the decoder. A window is released
+# when the next one is read. Files that can't be mapped (empty files, pipes)
+# are read in blocks instead
+def read_byte_windows(file, start=0, end=None):
+    if get_compression(file) is not None:
+        yield from read_decompressed_windows(file, start, end)
+        return
 
-                    else:
-                        common_words[word.capitalize()] = 1
+    with open(file, 'rb') as file_stream:
+        try:
+            mapped = mmap.mmap(
+                file_stream.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        except (ValueError, OSError):
+            mapped = None
 
-                line = file_stream.readline()
-    except Exception as e:
-        print(f'Unknown error reading file: {e}')
+        if mapped is None:
+            file_stream.seek(start)
+            position = start
+            while end is None or position < end:
+                read_size = READ_SIZE
+                if end is not None:
+                    read_size = min(READ_SIZE, end - position)
+                data = file_stream.read(read_size)
+                if data == b'':
+                    break
+                position += len(data)
+                yield data
+            return
 
-    for word in unique_words:
-        word_lengths_unique.append(len(word))
+        with mapped:
+            if end is None or end > len(mapped):
+                end = len(mapped)
+            with memoryview(mapped) as view:
+                for position in range(start, end, READ_SIZE):
+                    window_end = min(position + READ_SIZE, end)
+                    with view[position:window_end] as window:
+                        yield window
 
-    top_10_words = {}
-    words_only_once = []
-    counter = 0
-    for i in sorted(common_words, key=common_words.get, reverse=True):
-        if counter < 10:
-            top_10_words[i] = common_words[i]
-        if common_words[i] == 1:
-            words_only_once.append(i)
-        counter += 1
 
-    unique_words_count = len(unique_words)
+# Extension of a compressed file, None if it isn't compressed
+def get_compression(file):
+    for extension in COMPRESSED_EXTENSIONS:
+        if file.endswith(extension):
+            return extension
+    return None
 
-    # Package statistics in dictionary
-    statistics = {}
-    statistics['words_only_once_count'] = len(words_only_once)
-    statistics['unique_words_count'] = unique_words_count
-    statistics['word_lengths_unique'] = word_lengths_unique
-    statistics['word_lengths_duplicates'] = word_lengths_duplicates
-    statistics['words_above_6_chars'] = words_above_6_chars
 
-    return statistics, top_10_words, unique_words
+# Open a file for reading bytes, compressed files are decompressed while
+# they are read
+def open_binary(file):
+    compression = get_compression(file)
+    if compression == '.gz':
+        import gzip
+        return gzip.open(file, 'rb')
+    if compression == '.bz2':
+        import bz2
+        return bz2.open(file, 'rb')
+    if compression == '.xz':
+        import lzma
+        return lzma.open(file, 'rb')
+    return open(file, 'rb')
 
 
-# Sentence analysis (average words per sentence, longest and shortest,
-# sentence distribution)
-# Average words per sentence
-# • Longest and shortest sentences
-# • Sentence length distribution
-# Histogram of sentence lengths + bar chart of common lengths
-def sentence_analysis(file):
-    current_sentence = ''
-    sentences = []
-    sentence_stoppers = ['.', '?', '!']
-    avg_words_per_sentence = 0
-    total_words = 0
+# Yield the decompressed bytes from start to end of a compressed file in
+# windows of READ_SIZE bytes, decompressed ahead in a reader thread
+def read_decompressed_windows(file, start=0, end=None):
+    import queue
+    import threading
+
+    windows = queue.Queue(COMPRESSED_QUEUE_SIZE)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=decompress_windows, args=(file, start, end, windows, stop),
+        daemon=True
+    )
+    reader.start()
+    try:
+        while True:
+            window = windows.get()
+            if window is None:
+                break
+            if isinstance(window, Exception):
+                raise window
+            yield window
+    finally:
+        # Stop the reader when the analysis stops early and unblock it if
+        # it waits for room in the queue
+        stop.set()
+        while reader.is_alive():
+            try:
+                windows.get(timeout=0.1)
+            except queue.Empty:
+                pass
 
+
+# Reader thread of read_decompressed_windows: puts the windows in the queue,
+# then None when the end is reached or the error if reading failed. Bytes
+# before start are decompressed and skipped
+def decompress_windows(file, start, end, windows, stop):
     try:
-        with open(file, 'r', encoding='utf-8') as file_stream:
-            line = file_stream.readline()  # Read first line of the file
-            while line != '':
-                # Count total words
-                for word in line.split():
-                    total_words += 1
-                # Split line into sentences
-                for char in line:
-                    current_sentence += char
-                    if char in sentence_stoppers:
-                        sentence = current_sentence.strip()
-                        # If there are more than 2 words in the sentence
-                        # add it, otherwise skip
-                        if len(sentence.split()) >= 2:
-                            # If sentence isn't empty and is not something
-                            # like ..
-                            if (
-                                sentence != '' and
-                                sentence not in sentence_stoppers
-                            ):
-                                sentences.append(sentence)
-                        current_sentence = ''
-
-                line = file_stream.readline()
+        with open_binary(file) as file_stream:
+            position = 0
+            while not stop.is_set() and (end is None or position < end):
+                data = file_stream.read(READ_SIZE)
+                if data == b'':
+                    break
+                window_start = max(start - position, 0)
+                window_end = len(data)
+                if end is not None:
+                    window_end = min(window_end, end - position)
+                position += len(data)
+                if window_start < window_end:
+                    windows.put(data[window_start:window_end])
+        windows.put(None)
     except Exception as e:
-        print(f'Unknown error reading file: {e}')
+        windows.put(e)
 
-    if len(sentences) != 0:
-        avg_words_per_sentence = total_words / len(sentences)
-    else:
-        print('No sentences found in file.')
 
-    # Count characters per sentence
-    sentence_char_length = []
-    for i in sentences:
-        sentence_char_length.append(len(i) - 1)
-    # Put the sentence and wordcount into tuple
-    sentence_lengths = []
-    for sentence in sentences:
-        sentence_lengths.append((len(sentence.split()), sentence.split()))
-
-    # Find shortest and longest sentence
-    shortest_sentence = []
-    longest_sentence = []
-    min_sentence_length = 0
-    max_sentence_length = 0
-    for length, words in sentence_lengths:
-        if min_sentence_length == 0 or length < min_sentence_length:
-            min_sentence_length = length
-            shortest_sentence = words
-        if max_sentence_length == 0 or length > max_sentence_length:
-            max_sentence_length = length
-            longest_sentence = words
-    # Get only the length of sentences
-    only_lengths = []
-    for lengths, words in sentence_lengths:
-        only_lengths.append(lengths)
-    # 10 most common lengths
-    top_10_sentences = {}
-    lengths_counted = {}
-    for length in only_lengths:
-        if length in lengths_counted:
-            lengths_counted[length] += 1
-        else:
-            lengths_counted[length] = 1
-    counter = 0
-    for length in sorted(
-        lengths_counted, key=lengths_counted.get, reverse=True
+# Split the bytes from start to end of a file into byte ranges for parallel
+# analysis. Every range ends right after a newline, preferably on a line that
+# ends a sentence, so no line is split between two chunks
+def split_file(file, chunks, start=0, end=None):
+    if end is None:
+        end = os.path.getsize(file)
+    sentence_line_end = re.compile(rb'[.?!][ \t\r]*\n')
+    ranges = []
+    first = start
+
+    with open(file, 'rb') as file_stream:
+        for i in range(1, chunks, 1):
+            target = max(first + (end - first) * i // chunks, start)
+            file_stream.seek(target)
+            window = file_stream.read(CHUNK_SEARCH_SIZE)
+            match = sentence_line_end.search(window)
+            if match:
+                boundary = target + match.end()
+            else:
+                newline = window.find(b'\n')
+                # Keep reading until a line ends
+                while newline == -1 and window != b'':
+                    target += len(window)
+                    window = file_stream.read(CHUNK_SEARCH_SIZE)
+                    newline = window.find(b'\n')
+                if newline == -1:
+                    break
+                boundary = target + newline + 1
+            if boundary >= end:
+                break
+            if boundary > start:
+                ranges.append((start, boundary))
+                start = boundary
+
+    ranges.append((start, end))
+    return ranges
+
+
+# Analyse chunks of a file in a process pool and merge them in file order
+def analyse_file_parallel(file, workers, start=0, end=None, options=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    ranges = split_file(file, workers, start, end)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for range_start, range_end in ranges:
+            futures.append(
+                executor.submit(
+                    analyse_file_range, file, range_start, range_end, options
+                )
+            )
+        analysis = futures[0].result()
+        for future in futures[1:]:
+            merge_analysis(analysis, future.result())
+    return analysis
+
+
+# Create the counters that the analysis engine fills while reading
+def new_analysis(options=None, starts_mid_sentence=False):
+    analysis = {}
+    analysis['options'] = dict(options or {})
+    analysis['streaming'] = analysis['options'].get('streaming', False)
+    analysis['error'] = None
+    # Encoding and undecodable bytes, see new_decoding
+    analysis['decoding'] = new_decoding(analysis['options'])
+    # Basic statistics
+    analysis['total_lines'] = 0
+    analysis['total_words'] = 0
+    analysis['total_characters'] = 0
+    analysis['total_characters_no_spaces'] = 0
+    # Word analysis
+    # Every different word (lowercase) gets an integer ID the first time it
+    # appears, word_counts is how many times each ID appears and tokens the
+    # IDs of all words in text order (not kept when streaming). Not used for
+    # approximate top words
+    analysis['vocabulary'] = None
+    analysis['word_counts'] = None
+    analysis['tokens'] = None
+    analysis['heavy_hitters'] = None
+    if get_top_words_capacity(analysis['options']) is not None:
+        analysis['heavy_hitters'] = new_heavy_hitters(
+            get_top_words_capacity(analysis['options'])
+        )
+    else:
+        analysis['vocabulary'] = new_vocabulary()
+        analysis['word_counts'] = array.array('Q')
+        if not analysis['streaming']:
+            analysis['tokens'] = array.array('I')
+    analysis['hyperloglog'] = None
+    if analysis['options'].get('hyperloglog_precision'):
+        analysis['hyperloglog'] = new_hyperloglog(
+            analysis['options']['hyperloglog_precision']
+        )
+    # Length of every word in text order, 4 bytes per word so chunks
+    # analysed in parallel return it as one block of bytes. Not used when
+    # streaming
+    analysis['word_lengths_duplicates'] = array.array('I')
+    analysis['word_length_counts'] = {}
+    analysis['ngrams'] = None
+    if analysis['options'].get('ngram_size') is not None:
+        analysis['ngrams'] = new_ngram_analysis(analysis['options'])
+    analysis['words_above_6_chars'] = 0
+    # Sentence analysis
+    analysis['current_sentence'] = ''
+    analysis['sentences'] = []  # Not used when streaming
+    # Amount of words of every sentence, 4 bytes per sentence. Not used
+    # when streaming
+    analysis['sentence_lengths'] = array.array('I')
+    analysis['sentence_count'] = 0
+    analysis['sentence_length_counts'] = {}
+    analysis['shortest_sentence'] = None
+    analysis['longest_sentence'] = None
+    # Text up to the first sentence stopper of a chunk that started in the
+    # middle of a sentence, completed when the chunks are merged
+    analysis['starts_mid_sentence'] = starts_mid_sentence
+    analysis['sentence_head'] = None
+    analysis['readability'] = None
+    if analysis['options'].get('readability_unit') is not None or (
+        analysis['options'].get('readability_window') is not None
     ):
-        if counter < 10:
-            top_10_sentences[length] = lengths_counted[length]
-        counter += 1
-    # Convert longest and shortest senteces to strings
-    longest_sentence_str = ''
-    for word in longest_sentence:
-        longest_sentence_str += word + ' '
-    shortest_sentence_str = ''
-    for word in shortest_sentence:
-        shortest_sentence_str += word + ' '
-    # Package data
-    statistics = {}
-    statistics['top_10_sentence_lengths'] = top_10_sentences
-    statistics['sentence_lengths'] = sentence_lengths
-    statistics['only_lengths'] = only_lengths
-    statistics['shortest_sentence'] = shortest_sentence
-    statistics['shortest_sentence_str'] = shortest_sentence_str
-    statistics['longest_sentence'] = longest_sentence
-    statistics['longest_sentence_str'] = longest_sentence_str
-    statistics['avg_words_per_sentence'] = avg_words_per_sentence
+        analysis['readability'] = new_readability_analysis(
+            analysis['options']
+        )
+    # Character analysis
+    # How many times each character appears, in the order they first appear
+    analysis['char_counts'] = Counter()
+    # Time and counts per stage when profiling, see add_to_profile
+    analysis['profile'] = None
+    if PROFILE:
+        analysis['profile'] = {}
+    return analysis
 
-    return statistics
 
+# Add a block of whole lines of the file (the last line of the file may be
+# missing its newline) to all analyses except character analysis
+def update_analysis(analysis, text):
+    profile = analysis['profile']
+    started = time.perf_counter()
 
-# Character Analysis:
-# • Letter frequency distribution
-# • Punctuation statistics
-# • Case distribution (uppercase vs lowercase)
-# Bar chart of most common letters + pie chart of character types
-def character_analysis(file):
-    letter_counts = {}
-    punctuation_counts = {}
-    sentence_stoppers = ['.', '?', '!']
-    total_upper = 0
-    total_lower = 0
-    total_digits = 0
-    total_spaces = 0
-    total_chars = 0
-    try:
-        with open(file, 'r', encoding='utf-8') as file_stream:
-            for line in file_stream:
-                for char in line:
-                    total_chars += 1
-                    if char.isalpha():
-                        if letter_counts.get(char.lower()):
-                            letter_counts[char.lower()] += 1
-                        else:
-                            letter_counts[char.lower()] = 1
-                        if char.isupper():
-                            total_upper += 1
-                        else:
-                            total_lower += 1
-                    elif char.isdigit():
-                        total_digits += 1
-                    elif char.isspace():
-                        total_spaces += 1
-                    elif char in sentence_stoppers:
-                        if punctuation_counts.get(char):
-                            punctuation_counts[char] += 1
-                        else:
-                            punctuation_counts[char] = 1
-    except Exception as e:
-        print(f'Unknown error reading file: {e}')
+    # Basic statistics
+    lines = text.count('\n')
+    if not text.endswith('\n'):
+        lines += 1
+    analysis['total_lines'] += lines
+    analysis['total_words'] += len(text.split())
+    analysis['total_characters'] += len(text)
+    for line in text.split('\n'):
+        analysis['total_characters_no_spaces'] += len(
+            line.strip().replace(' ', '')
+        )
+    if profile is not None:
+        started = add_to_profile(
+            profile, 'basic_statistics', started, lines=lines
+        )
 
-    # Extract most common letters
-    sorted_letters = {}
-    counter = 0
-    for letter in sorted(letter_counts, key=letter_counts.get, reverse=True):
-        if counter < 12:
-            sorted_letters[letter] = letter_counts[letter]
-        counter += 1
+    # Word analysis
+    words = tokenize(text)
+    if profile is not None:
+        started = add_to_profile(
+            profile, 'tokenize', started, tokens=len(words)
+        )
+    word_length_counts = Counter(map(len, words))
+    merge_counts(analysis['word_length_counts'], word_length_counts)
+    if not analysis['streaming']:
+        analysis['word_lengths_duplicates'].extend(map(len, words))
+    # Count words above 6 chars (for LIX score)
+    for length, count in word_length_counts.items():
+        if length > 6:
+            analysis['words_above_6_chars'] += count
+    # Count how many times each word duplicates
+    heavy_hitters = analysis['heavy_hitters']
+    if heavy_hitters is None:
+        add_to_vocabulary_counts(analysis, words)
+    else:
+        add_to_heavy_hitters(heavy_hitters, words)
+    if analysis['hyperloglog'] is not None:
+        unique_words = set()
+        for word in set(words):
+            unique_words.add(word.capitalize())
+        add_to_hyperloglog(analysis['hyperloglog'], unique_words)
+    if profile is not None:
+        started = add_to_profile(
+            profile, 'word_counts', started, tokens=len(words)
+        )
+    if analysis['ngrams'] is not None:
+        add_to_ngram_analysis(analysis['ngrams'], words)
+        if profile is not None:
+            started = add_to_profile(
+                profile, 'ngrams', started, tokens=len(words)
+            )
 
-    total_letters = sum(letter_counts.values())
-    total_punct = sum(punctuation_counts.values())
-    # Any other chars (like %&¤ etc)
-    other_chars = total_chars - (
-        total_letters + total_punct + total_digits + total_spaces
-    )
+    # Sentence analysis, split text into sentences
+    sentence_count = analysis['sentence_count']
+    for sentence in iter_sentences(analysis, text):
+        add_sentence(analysis, sentence)
+    if profile is not None:
+        add_to_profile(
+            profile, 'sentences', started,
+            sentences=analysis['sentence_count'] - sentence_count
+        )
 
-    # Package data
-    statistics = {}
-    statistics['total_letters'] = total_letters
-    statistics['letter_counts'] = letter_counts
-    statistics['punctuation_counts'] = punctuation_counts
-    statistics['total_upper'] = total_upper
-    statistics['total_lower'] = total_lower
-    statistics['total_digits'] = total_digits
-    statistics['total_spaces'] = total_spaces
-    statistics['total_chars'] = total_chars
-    statistics['total_punctuations'] = total_punct
-    statistics['other_chars'] = other_chars
 
-    return statistics, sorted_letters
+# Profiling of the analysis stages, switched on with the --profile option or
+# the TEXT_ANALYSIS_PROFILE environment variable. When it is off the engine
+# only checks analysis['profile'] once per block of text
+PROFILE = os.environ.get('TEXT_ANALYSIS_PROFILE', '') not in ('', '0')
 
 
-def calculate_lix(file):
-    # Total words
-    o = get_basic_statistics(file)['total_words']
-    # Total sentences
-    m = len(sentence_analysis(file)['sentence_lengths'])
-    # Amount of words above 6 characters (access statistics dict from tuple
-    # with [0])
-    l = word_analysis(file)[0]['words_above_6_chars']
+# Switch profiling on, also for worker processes started after this
+def enable_profiling():
+    global PROFILE
+    PROFILE = True
+    os.environ['TEXT_ANALYSIS_PROFILE'] = '1'
 
-    LIX = (o / m) + ((l * 100) / o)
-    return round(LIX, 1)
 
+# Add the time since started and the counts of a block to a stage of a
+# profile. Returns the time the next stage starts
+def add_to_profile(
+    profile, stage, started, bytes_read=0, lines=0, tokens=0, sentences=0
+):
+    entry = profile.get(stage)
+    if entry is None:
+        entry = {}
+        entry['calls'] = 0
+        entry['seconds'] = 0.0
+        entry['bytes'] = 0
+        entry['lines'] = 0
+        entry['tokens'] = 0
+        entry['sentences'] = 0
+        entry['peak_memory_mb'] = None
+        profile[stage] = entry
+    now = time.perf_counter()
+    entry['calls'] += 1
+    entry['seconds'] += now - started
+    entry['bytes'] += bytes_read
+    entry['lines'] += lines
+    entry['tokens'] += tokens
+    entry['sentences'] += sentences
+    entry['peak_memory_mb'] = get_peak_memory_mb()
+    return now
 
-def export_statistics(file_to_analyse, comprehensive=False, json_export=False):
-    cwd = os.getcwd()
-    file_name = ''
 
-    print('Exporting...')
+# Merge the profile of another chunk. With several workers the seconds are
+# summed over all of them, so stages can add up to more than the wall time
+def merge_profiles(profile, other):
+    for stage, other_entry in other.items():
+        entry = profile.get(stage)
+        if entry is None:
+            profile[stage] = dict(other_entry)
+            continue
+        for key in ('calls', 'seconds', 'bytes', 'lines', 'tokens',
+                    'sentences'):
+            entry[key] += other_entry[key]
+        if entry['peak_memory_mb'] is None or (
+            other_entry['peak_memory_mb'] is not None
+            and other_entry['peak_memory_mb'] > entry['peak_memory_mb']
+        ):
+            entry['peak_memory_mb'] = other_entry['peak_memory_mb']
 
-    basic_statistics = get_basic_statistics(file_to_analyse)
-    word_analysis_stats, top_words, unique_words = word_analysis(
-        file_to_analyse
+
+# Highest resident set size of this process so far in MB, None if unknown
+def get_peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+# Print a profile as a table, one row per stage
+def print_profile(profile, file=None):
+    print(
+        f'{"Stage":<27}{"Calls":>7}{"Seconds":>10}{"Bytes":>13}'
+        f'{"Lines":>10}{"Tokens":>11}{"Sentences":>11}{"Peak MB":>9}',
+        file=file
     )
-    sentence_analysis_statistics = sentence_analysis(file_to_analyse)
-    char_analysis_stats, sorted_letters = character_analysis(file_to_analyse)
-    lix = calculate_lix(file_to_analyse)
+    for stage, entry in profile.items():
+        print(
+            f'{stage:<27}{entry["calls"]:>7}{entry["seconds"]:>10.4f}'
+            f'{entry["bytes"]:>13}{entry["lines"]:>10}'
+            f'{entry["tokens"]:>11}{entry["sentences"]:>11}'
+            f'{str(entry["peak_memory_mb"]):>9}',
+            file=file
+        )
 
-    if comprehensive:
-        file_name = 'comprehensive_export'
+
+# A sentence is everything up to and including the next . ? or !
+SENTENCE_PATTERN = re.compile(r'[^.?!]*[.?!]')
+
+
+# Splits a block of text into sentences, lazily. The unfinished sentence at
+# the end of the block is kept in analysis['current_sentence'] and continued
+# by the next block
+def iter_sentences(analysis, text):
+    end = 0
+    for match in SENTENCE_PATTERN.finditer(text):
+        sentence = analysis['current_sentence'] + match.group()
+        analysis['current_sentence'] = ''
+        end = match.end()
+        yield sentence
+    analysis['current_sentence'] += text[end:]
+
+
+# Reads the sentences of a file one at a time, the same sentences (at least
+# 2 words) that sentence_analysis finds, without keeping them all in memory
+def read_sentences(file):
+    analysis = {'current_sentence': ''}
+    for text in read_text_blocks(file):
+        for sentence in iter_sentences(analysis, text):
+            sentence = sentence.strip()
+            if len(sentence.split()) >= 2:
+                yield sentence
+
+
+# Keeps letters and whitespace and removes every other character (digits,
+# punctuation etc) when used as a str.translate table. Each different
+# character is only checked once
+class WordFilter(dict):
+    def __missing__(self, code):
+        char = chr(code)
+        if char.isalpha() or char.isspace():
+            self[code] = code
+        else:
+            self[code] = None
+        return self[code]
+
+
+WORD_FILTER = WordFilter()
+
+
+# Tokenizer shared by all word based analyses: splits text into lowercase
+# words, keeping only letters (so "don't" becomes "dont"). Works on whole
+# blocks of text, lines don't have to be split first
+def tokenize(text):
+    return text.lower().translate(WORD_FILTER).split()
+
+
+# Character analysis of a block of text. Every character is counted in bulk
+# and the different characters are classified once when the analysis is
+# finished, instead of classifying each character in Python
+def count_characters(analysis, text):
+    char_counts = analysis['char_counts']
+    if len(text) < NUMPY_MIN_SIZE or load_numpy() is None:
+        char_counts.update(text)
+        return
+
+    # Count the code points of the whole block at once
+    if text.isascii():
+        codes = numpy.frombuffer(text.encode('ascii'), dtype=numpy.uint8)
     else:
-        file_name = 'normal_export'
+        try:
+            # Text of single-byte encoded files mostly fits in Latin-1, one
+            # byte per character
+            codes = numpy.frombuffer(
+                text.encode('latin-1'), dtype=numpy.uint8
+            )
+        except UnicodeEncodeError:
+            codes = numpy.frombuffer(
+                text.encode('utf-32-le', 'surrogatepass'),
+                dtype=numpy.uint32
+            )
+    counts = numpy.bincount(codes)
+    present = numpy.flatnonzero(counts)
 
-    if json_export:
-        file_name += '.json'
+    # New characters are added in the order they first appear in the text,
+    # like Counter does, so letters with the same count keep their order
+    new_chars = []
+    for code, count in zip(present.tolist(), counts[present].tolist()):
+        char = chr(code)
+        if char in char_counts:
+            char_counts[char] += count
+        else:
+            new_chars.append((text.find(char), char, count))
+    new_chars.sort()
+    for position, char, count in new_chars:
+        char_counts[char] = count
+
+
+# Import NumPy the first time it is needed
+def load_numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+# Add a sentence that ended with a sentence stopper
+def add_sentence(analysis, text):
+    if analysis['starts_mid_sentence'] and analysis['sentence_head'] is None:
+        analysis['sentence_head'] = text
+        return
+
+    sentence = text.strip()
+    words = sentence.split()
+    # Only keep sentences with at least 2 words (this also skips empty
+    # sentences and things like ..)
+    if len(words) < 2:
+        if analysis['readability'] is not None:
+            add_skipped_text_to_readability_analysis(
+                analysis['readability'], text
+            )
+        return
+    if analysis['readability'] is not None:
+        add_to_readability_analysis(analysis['readability'], text, words)
+
+    if not analysis['streaming']:
+        analysis['sentences'].append(sentence)
+        analysis['sentence_lengths'].append(len(words))
+    analysis['sentence_count'] += 1
+    length_counts = analysis['sentence_length_counts']
+    if len(words) in length_counts:
+        length_counts[len(words)] += 1
     else:
-        file_name += '.txt'
+        length_counts[len(words)] = 1
+    # The first of the shortest and longest sentences is kept
+    shortest_sentence = analysis['shortest_sentence']
+    if shortest_sentence is None or len(words) < len(shortest_sentence):
+        analysis['shortest_sentence'] = words
+    longest_sentence = analysis['longest_sentence']
+    if longest_sentence is None or len(words) > len(longest_sentence):
+        analysis['longest_sentence'] = words
 
-    if os.path.exists(cwd + '/' + file_name):
-        print(
-            f'Prevented overwriting. {file_name} already exists, please '
-            'rename or remove it.'
+
+# Add counts from a dictionary to another, new keys are added in the order
+# they appear
+def merge_counts(counts, other_counts):
+    for key, count in other_counts.items():
+        if key in counts:
+            counts[key] += count
+        else:
+            counts[key] = count
+
+
+# Vocabulary: every different word (normalized by tokenize) is stored once
+# and gets an integer ID, in the order the words first appear. The engine
+# counts words by ID and keeps the words of the file as an array('I') of
+# IDs, 4 bytes per word. Words are only capitalized for the results
+def new_vocabulary():
+    vocabulary = {}
+    vocabulary['words'] = []
+    vocabulary['ids'] = {}
+    return vocabulary
+
+
+# IDs of a list of words as an array, new words are added to the vocabulary
+def intern_words(vocabulary, words):
+    ids = vocabulary['ids']
+    # Each different word is only looked at once, in the order they appear
+    for word in dict.fromkeys(words):
+        if word not in ids:
+            ids[word] = len(vocabulary['words'])
+            vocabulary['words'].append(word)
+    return array.array('I', map(ids.__getitem__, words))
+
+
+# Count the words of a block by ID, new words are added to the vocabulary.
+# The words are counted as strings first, so only each different word of
+# the block is looked up in the vocabulary
+def add_to_vocabulary_counts(analysis, words):
+    vocabulary = analysis['vocabulary']
+    ids = vocabulary['ids']
+    word_counts = analysis['word_counts']
+    for word, count in Counter(words).items():
+        word_id = ids.get(word)
+        if word_id is None:
+            ids[word] = len(vocabulary['words'])
+            vocabulary['words'].append(word)
+            word_counts.append(count)
+        else:
+            word_counts[word_id] += count
+    if analysis['tokens'] is not None:
+        analysis['tokens'].extend(map(ids.__getitem__, words))
+
+
+# Merge the word counts and tokens of the chunk that follows an analysis.
+# The IDs of the other chunk are turned into IDs of this vocabulary, words
+# that are new to it are added in the order they appear in the other chunk
+def merge_vocabulary_counts(analysis, other):
+    new_ids = intern_words(
+        analysis['vocabulary'], other['vocabulary']['words']
+    )
+    word_counts = analysis['word_counts']
+    word_counts.extend(itertools.repeat(
+        0, len(analysis['vocabulary']['words']) - len(word_counts)
+    ))
+    for other_id, count in enumerate(other['word_counts']):
+        word_counts[new_ids[other_id]] += count
+    if analysis['tokens'] is not None:
+        analysis['tokens'].extend(map(new_ids.__getitem__, other['tokens']))
+
+
+# How many times each word appears as {word (lowercase): count}, for exact
+# word counts
+def get_word_counts(analysis):
+    return dict(zip(analysis['vocabulary']['words'], analysis['word_counts']))
+
+
+# Merge the analysis of the chunk that directly follows an analysis into it.
+# The result is the same as if both chunks were analysed as one
+def merge_analysis(analysis, other):
+    if analysis['error'] is None:
+        analysis['error'] = other['error']
+    if analysis['profile'] is not None and other['profile'] is not None:
+        merge_profiles(analysis['profile'], other['profile'])
+    merge_decoding(analysis['decoding'], other['decoding'])
+
+    for key in (
+        'total_lines', 'total_words', 'total_characters',
+        'total_characters_no_spaces', 'words_above_6_chars'
+    ):
+        analysis[key] += other[key]
+    if analysis['vocabulary'] is not None:
+        merge_vocabulary_counts(analysis, other)
+    if analysis['heavy_hitters'] is not None:
+        merge_heavy_hitters(analysis['heavy_hitters'], other['heavy_hitters'])
+    if analysis['hyperloglog'] is not None:
+        merge_hyperloglog(analysis['hyperloglog'], other['hyperloglog'])
+    if analysis['ngrams'] is not None:
+        merge_ngram_analysis(analysis['ngrams'], other['ngrams'])
+    merge_counts(analysis['word_length_counts'], other['word_length_counts'])
+    merge_counts(analysis['char_counts'], other['char_counts'])
+    analysis['word_lengths_duplicates'].extend(
+        other['word_lengths_duplicates']
+    )
+
+    # Join the sentence that straddles both chunks. A chunk that was
+    # analysed from the start of a sentence (like the start of the file)
+    # has no head, its sentences are all in its own results
+    if not other['starts_mid_sentence']:
+        add_sentence(analysis, analysis['current_sentence'])
+    elif other['sentence_head'] is None:
+        analysis['current_sentence'] += other['current_sentence']
+        return analysis
+    else:
+        add_sentence(
+            analysis, analysis['current_sentence'] + other['sentence_head']
         )
+    analysis['current_sentence'] = other['current_sentence']
+
+    analysis['sentences'].extend(other['sentences'])
+    analysis['sentence_lengths'].extend(other['sentence_lengths'])
+    analysis['sentence_count'] += other['sentence_count']
+    if analysis['readability'] is not None:
+        merge_readability_analysis(
+            analysis['readability'], other['readability']
+        )
+    merge_counts(
+        analysis['sentence_length_counts'], other['sentence_length_counts']
+    )
+    if other['shortest_sentence'] is not None:
+        if analysis['shortest_sentence'] is None or len(
+            other['shortest_sentence']
+        ) < len(analysis['shortest_sentence']):
+            analysis['shortest_sentence'] = other['shortest_sentence']
+        if analysis['longest_sentence'] is None or len(
+            other['longest_sentence']
+        ) > len(analysis['longest_sentence']):
+            analysis['longest_sentence'] = other['longest_sentence']
+    return analysis
+
+
+# Most common keys of a dictionary of counts as {key: count}. Keys with the
+# same count are kept in the order they were first counted
+def top_k(counts, k):
+    top = {}
+    for key in heapq.nlargest(k, counts, key=counts.get):
+        top[key] = counts[key]
+    return top
+
+
+# Heavy hitters (Misra-Gries summary): counts the most common words while
+# keeping at most about 2 * capacity words in memory. When it grows too big,
+# the count of the capacity + 1:th most common word is subtracted from all
+# words and words that reach 0 are dropped. Each count is then at most
+# 'error' too low, and error is never more than total / (capacity + 1)
+def new_heavy_hitters(capacity):
+    heavy_hitters = {}
+    heavy_hitters['capacity'] = capacity
+    heavy_hitters['counts'] = Counter()
+    heavy_hitters['error'] = 0
+    heavy_hitters['total'] = 0
+    return heavy_hitters
+
+
+def prune_heavy_hitters(heavy_hitters):
+    counts = heavy_hitters['counts']
+    capacity = heavy_hitters['capacity']
+    if len(counts) <= capacity:
         return
+    threshold = heapq.nlargest(capacity + 1, counts.values())[-1]
+    pruned_counts = Counter()
+    for key, count in counts.items():
+        if count > threshold:
+            pruned_counts[key] = count - threshold
+    heavy_hitters['counts'] = pruned_counts
+    heavy_hitters['error'] += threshold
 
-    if comprehensive:
-        # Comprehensive report, text file
-        if not json_export:
-            try:
-                with open(file_name, 'w', encoding='utf-8') as file_stream:
-                    file_stream.write('===== Basic Statistics =====\n')
-                    for key in basic_statistics.keys():
-                        file_stream.write(f'{key} : {basic_statistics[key]}\n')
-                    file_stream.write(f'LIX: {str(lix)}')
-
-                    file_stream.write('\n===== Word Analysis =====\n')
-                    for key in word_analysis_stats.keys():
-                        file_stream.write(
-                            f'{key} : {word_analysis_stats[key]}\n'
-                        )
-                    file_stream.write('----- Top 10 words -----\n')
-                    for key in top_words.keys():
-                        file_stream.write(
-                            f'{key} appears {top_words[key]} times\n'
-                        )
-                    file_stream.write('----- List of unique words -----\n')
-                    for word in unique_words:
-                        file_stream.write(f'{word}, ')
-
-                    file_stream.write('\n\n===== Sentence Analysis =====\n')
-                    for key in sentence_analysis_statistics.keys():
-                        file_stream.write(
-                            f'{key} : {sentence_analysis_statistics[key]}\n'
-                        )
 
-                    file_stream.write('\n===== Character Analysis =====\n')
-                    for key in char_analysis_stats.keys():
-                        file_stream.write(
-                            f'{key} : {char_analysis_stats[key]}\n'
-                        )
-                    file_stream.write('----- Top 12 Letters -----\n')
-                    for letter in sorted_letters.keys():
-                        file_stream.write(
-                            f'{letter} appears {sorted_letters[letter]} times\n'
-                        )
-            except Exception as e:
-                print(f'Error exporting text file: {e}')
-                return
-        # Comprehensive report, JSON
-        else:
-            try:
-                json_export_dict = {}
-
-                json_export_dict['basic_statistics'] = basic_statistics
-                json_export_dict['LIX_score'] = lix
-                json_export_dict['word_analysis'] = word_analysis_stats
-                json_export_dict['top_10_words'] = top_words
-                json_export_dict['sentence_stats'] = sentence_analysis_statistics
-                json_export_dict['char_stats'] = char_analysis_stats
-                json_export_dict['sorted_letters'] = sorted_letters
-
-                with open(file_name, 'w', encoding='utf-8') as json_fs:
-                    json.dump(
-                        json_export_dict,
-                        json_fs,
-                        indent=4,
-                        ensure_ascii=False
-                    )
+# Count a list of words in heavy hitters
+def add_to_heavy_hitters(heavy_hitters, words):
+    heavy_hitters['counts'].update(words)
+    heavy_hitters['total'] += len(words)
+    if len(heavy_hitters['counts']) > heavy_hitters['capacity'] * 2:
+        prune_heavy_hitters(heavy_hitters)
+
+
+# Merge heavy hitters of another chunk or file, the error bound still holds
+# for the merged summary. Like add_to_heavy_hitters it only prunes when
+# there are more than 2 * capacity words, so merging chunks that were never
+# pruned gives exact counts
+def merge_heavy_hitters(heavy_hitters, other):
+    merge_counts(heavy_hitters['counts'], other['counts'])
+    heavy_hitters['error'] += other['error']
+    heavy_hitters['total'] += other['total']
+    if len(heavy_hitters['counts']) > heavy_hitters['capacity'] * 2:
+        prune_heavy_hitters(heavy_hitters)
+
+
+# N-gram analysis: the most common runs of n words (bigrams, trigrams, ...)
+# of the word stream, also across lines and sentences. There are many more
+# different n-grams than words, so they are always counted with heavy
+# hitters: memory stays below about 2 * capacity n-grams, and with a large
+# enough capacity only n-grams that appear a few times are pruned.
+# N-grams are counted as tuples of lowercase words. The last n - 1 words
+# (tail) are kept to count the n-grams that continue in the next block, and
+# the first n - 1 words (head) to count the n-grams that start in the
+# previous chunk when chunks are merged
+NGRAM_CAPACITY = 100000
+
+# Common English words, left out with the ngram_stopwords option
+STOPWORDS = frozenset((
+    'a', 'about', 'after', 'all', 'also', 'am', 'an', 'and', 'any', 'are',
+    'as', 'at', 'be', 'because', 'been', 'before', 'being', 'but', 'by',
+    'can', 'could', 'did', 'do', 'does', 'for', 'from', 'had', 'has',
+    'have', 'he', 'her', 'here', 'hers', 'him', 'his', 'how', 'i', 'if',
+    'in', 'into', 'is', 'it', 'its', 'just', 'me', 'more', 'my', 'no',
+    'nor', 'not', 'now', 'o', 'of', 'on', 'one', 'or', 'our', 'out', 'own',
+    'say', 'said', 'she', 'should', 'so', 'some', 'such', 'than', 'that',
+    'the', 'their', 'them', 'then', 'there', 'these', 'they', 'this',
+    'those', 'thou', 'thy', 'thee', 'to', 'too', 'up', 'upon', 'us', 'very',
+    'was', 'we', 'were', 'what', 'when', 'where', 'which', 'while', 'who',
+    'whom', 'why', 'will', 'with', 'would', 'ye', 'yet', 'you', 'your'
+))
+
+
+def new_ngram_analysis(options):
+    if options['ngram_size'] < 1:
+        raise ValueError('N-gram size must be at least 1')
+    ngrams = {}
+    ngrams['size'] = options['ngram_size']
+    ngrams['heavy_hitters'] = new_heavy_hitters(
+        options.get('ngram_capacity') or NGRAM_CAPACITY
+    )
+    ngrams['stopwords'] = frozenset()
+    if options.get('ngram_stopwords') is True:
+        ngrams['stopwords'] = STOPWORDS
+    elif options.get('ngram_stopwords'):
+        ngrams['stopwords'] = frozenset(options['ngram_stopwords'])
+    ngrams['head'] = []
+    ngrams['tail'] = []
+    return ngrams
+
+
+# N-grams of a list of words, without the ones containing a stopword
+def get_ngrams(words, size, stopwords):
+    runs = []
+    for i in range(0, size, 1):
+        runs.append(words[i:])
+    if not stopwords:
+        return list(zip(*runs))
+    ngrams = []
+    for ngram in zip(*runs):
+        if stopwords.isdisjoint(ngram):
+            ngrams.append(ngram)
+    return ngrams
+
+
+# Count the n-grams of the next words of the word stream
+def add_to_ngram_analysis(ngrams, words):
+    size = ngrams['size']
+    if len(ngrams['head']) < size - 1:
+        ngrams['head'].extend(words[:size - 1 - len(ngrams['head'])])
+    words = ngrams['tail'] + words
+    add_to_heavy_hitters(
+        ngrams['heavy_hitters'],
+        get_ngrams(words, size, ngrams['stopwords'])
+    )
+    if size > 1:
+        ngrams['tail'] = words[-(size - 1):]
+
+
+# Merge the n-grams of the chunk that directly follows. The tail and head
+# are shorter than n, so every n-gram made of them crosses the chunks
+def merge_ngram_analysis(ngrams, other):
+    size = ngrams['size']
+    words = ngrams['tail'] + other['head']
+    merge_heavy_hitters(
+        ngrams['heavy_hitters'],
+        other['heavy_hitters']
+    )
+    add_to_heavy_hitters(
+        ngrams['heavy_hitters'],
+        get_ngrams(words, size, ngrams['stopwords'])
+    )
+    if len(ngrams['head']) < size - 1:
+        ngrams['head'].extend(other['head'][:size - 1 - len(ngrams['head'])])
+    if size > 1:
+        ngrams['tail'] = (ngrams['tail'] + other['tail'])[-(size - 1):]
+
+
+# N-gram analysis: bar chart of the most common n-grams
+# Most common n-grams (top 10), counts at most top_ngrams_max_error too low
+# • Amount of n-grams counted
+def finish_ngram_analysis(analysis):
+    ngrams = analysis['ngrams']
+    heavy_hitters = ngrams['heavy_hitters']
+    joined_counts = {}
+    for ngram, count in heavy_hitters['counts'].items():
+        joined_counts[' '.join(ngram)] = count
+    top_ngrams = top_k(
+        capitalize_words(joined_counts),
+        analysis['options'].get('top_ngrams', 10)
+    )
+    statistics = {}
+    statistics['ngram_size'] = ngrams['size']
+    statistics['total_ngrams'] = heavy_hitters['total']
+    statistics['top_ngrams_max_error'] = heavy_hitters['error']
+    statistics['stopwords_excluded'] = len(ngrams['stopwords']) != 0
+    return statistics, top_ngrams
+
+
+# Readability profile: LIX, average sentence length and share of long words
+# per window of the text, to see how readability changes through a long
+# work. Windows are made of whole sentences and are one of:
+# words: a window ends with the sentence that reaches N words
+# sentences: N sentences per window
+# chapters: a window starts with every sentence that contains a chapter
+#   heading (a line like BOOK IV or CHAPTER 12, or chapter_pattern)
+# While reading only the words and long words (more than 6 letters) of
+# every sentence are kept, in two arrays of 4 bytes per sentence, and the
+# sentences where chapters start. Chunks are merged by joining the arrays,
+# and the windows are summed up in one pass when the analysis is finished
+READABILITY_UNITS = ('words', 'sentences', 'chapters')
+# Default window size of each unit
+READABILITY_WINDOWS = {'words': 1000, 'sentences': 50, 'chapters': None}
+CHAPTER_PATTERN = (
+    r'^[ \t]*(?:BOOK|Book|CHAPTER|Chapter|PART|Part)[ \t]+'
+    r'(?:[IVXLCDM]+|\d+)\b'
+)
+
+
+def new_readability_analysis(options):
+    unit = options.get('readability_unit') or 'words'
+    if unit not in READABILITY_UNITS:
+        raise ValueError(
+            f'Unknown readability unit {unit}, use one of '
+            f'{", ".join(READABILITY_UNITS)}'
+        )
+    window = options.get('readability_window')
+    if unit == 'chapters' or window is None:
+        window = READABILITY_WINDOWS[unit]
+    elif window < 1:
+        raise ValueError('Readability window must be at least 1')
+    readability = {}
+    readability['unit'] = unit
+    readability['window'] = window
+    readability['chapter_pattern'] = None
+    if unit == 'chapters':
+        readability['chapter_pattern'] = re.compile(
+            options.get('chapter_pattern') or CHAPTER_PATTERN, re.MULTILINE
+        )
+    readability['words'] = array.array('I')
+    readability['long_words'] = array.array('I')
+    # Sentences that start a chapter
+    readability['chapters'] = []
+    # A heading was found in text that wasn't counted as a sentence, the
+    # next sentence starts the chapter
+    readability['chapter_pending'] = False
+    return readability
+
+
+# Add a sentence (at least 2 words) to the readability profile
+def add_to_readability_analysis(readability, text, words):
+    if readability['chapter_pattern'] is not None and (
+        readability['chapter_pending']
+        or readability['chapter_pattern'].search(text)
+    ):
+        readability['chapters'].append(len(readability['words']))
+        readability['chapter_pending'] = False
+    long_words = 0
+    for word in tokenize(text):
+        if len(word) > 6:
+            long_words += 1
+    readability['words'].append(len(words))
+    readability['long_words'].append(long_words)
+
+
+# Text that isn't counted as a sentence may still hold a chapter heading
+def add_skipped_text_to_readability_analysis(readability, text):
+    if readability['chapter_pattern'] is not None and (
+        readability['chapter_pattern'].search(text)
+    ):
+        readability['chapter_pending'] = True
+
+
+# Merge the readability profile of the chunk that directly follows
+def merge_readability_analysis(readability, other):
+    offset = len(readability['words'])
+    chapters = other['chapters']
+    # A heading at the end of this chunk starts the first chapter of the
+    # next one
+    if readability['chapter_pending'] and (
+        len(chapters) == 0 or chapters[0] != 0
+    ):
+        chapters = [0] + chapters
+    for chapter in chapters:
+        readability['chapters'].append(chapter + offset)
+    readability['words'].extend(other['words'])
+    readability['long_words'].extend(other['long_words'])
+    readability['chapter_pending'] = other['chapter_pending']
+
+
+# Readability profile as a compact time series: one list per column with an
+# entry per window
+# • Sentence and word the window starts at (from 0)
+# • Sentences and words in the window
+# • LIX, average words per sentence and percentage of long words
+def finish_readability_analysis(analysis):
+    readability = analysis['readability']
+    words = readability['words']
+    long_words = readability['long_words']
+
+    # First sentence of every window
+    starts = []
+    if readability['unit'] == 'chapters':
+        starts = sorted(set([0] + readability['chapters']))
+    elif readability['unit'] == 'sentences':
+        starts = list(range(0, len(words), readability['window']))
+    else:
+        window_words = 0
+        for i in range(0, len(words), 1):
+            if window_words == 0:
+                starts.append(i)
+            window_words += words[i]
+            if window_words >= readability['window']:
+                window_words = 0
+
+    profile = {}
+    profile['unit'] = readability['unit']
+    profile['window'] = readability['window']
+    for key in (
+        'start_sentence', 'start_word', 'sentences', 'words', 'lix',
+        'avg_sentence_length', 'long_words_percent'
+    ):
+        profile[key] = []
+    word_position = 0
+    for i in range(0, len(starts), 1):
+        start = starts[i]
+        end = len(words)
+        if i + 1 < len(starts):
+            end = starts[i + 1]
+        if start >= end:
+            continue
+        window_words = sum(words[start:end])
+        window_long_words = sum(long_words[start:end])
+        profile['start_sentence'].append(start)
+        profile['start_word'].append(word_position)
+        profile['sentences'].append(end - start)
+        profile['words'].append(window_words)
+        profile['lix'].append(
+            lix_score(window_words, end - start, window_long_words)
+        )
+        profile['avg_sentence_length'].append(
+            round(window_words / (end - start), 1)
+        )
+        profile['long_words_percent'].append(
+            round(window_long_words * 100 / max(window_words, 1), 1)
+        )
+        word_position += window_words
+    return profile
+
+
+# Words counted by the heavy hitters of the most common words when the
+# amount of unique words is estimated without approximate_top_words
+HYPERLOGLOG_TOP_WORDS_CAPACITY = 10000
+
+
+# Capacity of the heavy hitters that count the most common words, None when
+# every word is counted. A HyperLogLog estimate only saves memory when the
+# vocabulary isn't kept, so it implies heavy hitters
+def get_top_words_capacity(options):
+    if options.get('approximate_top_words'):
+        return options['approximate_top_words']
+    if options.get('hyperloglog_precision'):
+        return HYPERLOGLOG_TOP_WORDS_CAPACITY
+    return None
+
+
+# HyperLogLog sketch: estimates how many different words were added using
+# 2 ** precision one byte registers. Every word is hashed; the first bits of
+# the hash pick a register, which keeps the highest position of the first 1
+# bit in the rest. Sketches of different chunks and files can be merged
+def new_hyperloglog(precision):
+    if not 4 <= precision <= 16:
+        raise ValueError('HyperLogLog precision must be between 4 and 16')
+    hyperloglog = {}
+    hyperloglog['precision'] = precision
+    hyperloglog['registers'] = bytearray(1 << precision)
+    return hyperloglog
+
+
+def add_to_hyperloglog(hyperloglog, words):
+    precision = hyperloglog['precision']
+    registers = hyperloglog['registers']
+    rest_bits = 64 - precision
+    rest_mask = (1 << rest_bits) - 1
+    for word in words:
+        word_hash = int.from_bytes(
+            hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(),
+            'big'
+        )
+        index = word_hash >> rest_bits
+        rank = rest_bits - (word_hash & rest_mask).bit_length() + 1
+        if rank > registers[index]:
+            registers[index] = rank
+
+
+def merge_hyperloglog(hyperloglog, other):
+    registers = hyperloglog['registers']
+    other_registers = other['registers']
+    for i in range(0, len(registers), 1):
+        if other_registers[i] > registers[i]:
+            registers[i] = other_registers[i]
+
+
+# Estimated amount of different words and its standard error
+def estimate_hyperloglog(hyperloglog):
+    registers = hyperloglog['registers']
+    m = len(registers)
+    if m == 16:
+        alpha = 0.673
+    elif m == 32:
+        alpha = 0.697
+    elif m == 64:
+        alpha = 0.709
+    else:
+        alpha = 0.7213 / (1 + 1.079 / m)
+
+    total = 0
+    for register in registers:
+        total += 2.0 ** -register
+    estimate = alpha * m * m / total
+    # Small amounts are counted more precisely from the empty registers
+    empty_registers = registers.count(0)
+    if estimate <= 2.5 * m and empty_registers != 0:
+        estimate = m * math.log(m / empty_registers)
+
+    standard_error = 1.04 / math.sqrt(m)
+    return round(estimate), round(estimate * standard_error, 1)
+
+
+# Turn the filled counters into the results of every analysis
+def finish_analysis(analysis):
+    profile = analysis['profile']
+    results = {}
+    results['error'] = analysis['error']
+    results['options'] = analysis['options']
+    for key, finish in (
+        ('basic_statistics', finish_basic_statistics),
+        ('word_analysis', finish_word_analysis),
+        ('sentence_analysis', finish_sentence_analysis),
+        ('character_analysis', finish_character_analysis)
+    ):
+        started = time.perf_counter()
+        results[key] = finish(analysis)
+        if profile is not None:
+            add_to_profile(profile, f'finish_{key}', started)
+    # Only when n-grams were counted
+    if analysis['ngrams'] is not None:
+        started = time.perf_counter()
+        results['ngram_analysis'] = finish_ngram_analysis(analysis)
+        if profile is not None:
+            add_to_profile(profile, 'finish_ngram_analysis', started)
+    # Only when a readability profile was asked for
+    if analysis['readability'] is not None:
+        started = time.perf_counter()
+        results['readability_profile'] = finish_readability_analysis(
+            analysis
+        )
+        if profile is not None:
+            add_to_profile(profile, 'finish_readability_profile', started)
+
+    results['lix'] = lix_score(
+        analysis['total_words'], analysis['sentence_count'],
+        analysis['words_above_6_chars']
+    )
+    results['encoding'] = {}
+    results['encoding']['encoding'] = analysis['decoding']['encoding']
+    results['encoding']['encoding_errors'] = analysis['decoding']['errors']
+    results['encoding']['undecodable_bytes'] = (
+        analysis['decoding']['undecodable_bytes']
+    )
+    if profile is not None:
+        results['timings'] = profile
+    return results
+
+
+# Whether reports include the encoding section: only for files that aren't
+# plain UTF-8 (or ASCII) text
+def has_encoding_report(results):
+    encoding = results.get('encoding')
+    if encoding is None or encoding['encoding'] is None:
+        return False
+    return encoding['encoding'] not in ('ascii', 'utf-8') or (
+        encoding['undecodable_bytes'] != 0
+    )
+
+
+# LIX = words / sentences + (long words * 100) / words
+def lix_score(o, m, l):
+    if o != 0 and m != 0:
+        return round((o / m) + ((l * 100) / o), 1)
+    return 0
+
+
+# Basic statistics: bar chart of text composition and pie chart of
+# character types
+# Total number of lines
+# Total number of words
+# Total number of characters (with and without spaces)
+# Average words per line
+# Average characters per word
+def finish_basic_statistics(analysis):
+    statistics = {}
+    statistics['total_words'] = analysis['total_words']
+    statistics['total_lines'] = 0
+    statistics['total_characters'] = analysis['total_characters']
+    statistics['total_characters_no_spaces'] = (
+        analysis['total_characters_no_spaces']
+    )
+    statistics['avg_words_per_line'] = 0
+    statistics['avg_characters_per_word'] = 0
+
+    if analysis['total_lines'] != 0:
+        statistics['total_lines'] = analysis['total_lines']
+        statistics['avg_words_per_line'] = round(
+            statistics['total_words'] / statistics['total_lines'], 3
+        )
+        if statistics['total_words'] != 0:
+            statistics['avg_characters_per_word'] = round(
+                statistics['total_characters_no_spaces'] /
+                statistics['total_words'],
+                3
+            )
+    else:
+        print('File was empty.')
+    return statistics
+
+
+# Word analysis: bar chart of most common words and histogram of word lengths
+# Most common words (top 10)
+# • Word length distribution
+# • Unique word count
+# • Words appearing only once
+def finish_word_analysis(analysis):
+    top_words = analysis['options'].get('top_words', 10)
+    heavy_hitters = analysis['heavy_hitters']
+    statistics = {}
+
+    if heavy_hitters is not None:
+        # Only the most common words are known, their counts are estimates
+        prune_heavy_hitters(heavy_hitters)
+        top_10_words = top_k(
+            capitalize_words(heavy_hitters['counts']), top_words
+        )
+        statistics['words_only_once_count'] = None
+        add_unique_words_count(statistics, analysis, None)
+        statistics['top_words_max_error'] = heavy_hitters['error']
+        if analysis['streaming']:
+            statistics['word_length_counts'] = dict(
+                sorted(analysis['word_length_counts'].items())
+            )
+        else:
+            statistics['word_lengths_duplicates'] = (
+                analysis['word_lengths_duplicates']
+            )
+        statistics['words_above_6_chars'] = analysis['words_above_6_chars']
+        return statistics, top_10_words, set()
+
+    common_words = capitalize_words(get_word_counts(analysis))
+    unique_words = set(common_words)
+
+    word_lengths_unique = []
+    for word in unique_words:
+        word_lengths_unique.append(len(word))
+
+    top_10_words = top_k(common_words, top_words)
+    words_only_once_count = 0
+    for count in common_words.values():
+        if count == 1:
+            words_only_once_count += 1
+
+    # Package statistics in dictionary
+    statistics['words_only_once_count'] = words_only_once_count
+    add_unique_words_count(statistics, analysis, len(unique_words))
+    if analysis['streaming']:
+        # Length distributions as {length: amount}
+        statistics['unique_word_length_counts'] = count_lengths(
+            word_lengths_unique
+        )
+        statistics['word_length_counts'] = dict(
+            sorted(analysis['word_length_counts'].items())
+        )
+    else:
+        statistics['word_lengths_unique'] = word_lengths_unique
+        statistics['word_lengths_duplicates'] = (
+            analysis['word_lengths_duplicates']
+        )
+    statistics['words_above_6_chars'] = analysis['words_above_6_chars']
+
+    return statistics, top_10_words, unique_words
+
+
+# Word counts with the words capitalized like in the results. Different
+# lowercase words can have the same capitalized form (ßa and ssa are both Ssa)
+def capitalize_words(word_counts):
+    common_words = {}
+    for word, count in word_counts.items():
+        word = word.capitalize()
+        if word in common_words:
+            common_words[word] += count
+        else:
+            common_words[word] = count
+    return common_words
+
+
+# Add the amount of unique words to word statistics, as an estimate with its
+# standard error when it was counted with HyperLogLog
+def add_unique_words_count(statistics, analysis, unique_words_count):
+    if analysis['hyperloglog'] is None:
+        statistics['unique_words_count'] = unique_words_count
+        return
+    estimate, standard_error = estimate_hyperloglog(analysis['hyperloglog'])
+    statistics['unique_words_estimate'] = estimate
+    statistics['unique_words_standard_error'] = standard_error
+
+
+# Sentence analysis (average words per sentence, longest and shortest,
+# sentence distribution)
+# Average words per sentence
+# • Longest and shortest sentences
+# • Sentence length distribution
+# Histogram of sentence lengths + bar chart of common lengths
+def finish_sentence_analysis(analysis):
+    avg_words_per_sentence = 0
+
+    if analysis['sentence_count'] != 0:
+        avg_words_per_sentence = (
+            analysis['total_words'] / analysis['sentence_count']
+        )
+    else:
+        print('No sentences found in file.')
+
+    # 10 most common lengths
+    lengths_counted = analysis['sentence_length_counts']
+    top_10_sentences = top_k(lengths_counted, 10)
+
+    shortest_sentence = analysis['shortest_sentence'] or []
+    longest_sentence = analysis['longest_sentence'] or []
+    # Convert longest and shortest senteces to strings
+    longest_sentence_str = ''
+    for word in longest_sentence:
+        longest_sentence_str += word + ' '
+    shortest_sentence_str = ''
+    for word in shortest_sentence:
+        shortest_sentence_str += word + ' '
+    # Package data
+    statistics = {}
+    statistics['top_10_sentence_lengths'] = top_10_sentences
+    if analysis['streaming']:
+        statistics['sentence_length_counts'] = dict(
+            sorted(lengths_counted.items())
+        )
+        statistics['sentence_count'] = analysis['sentence_count']
+    else:
+        # The sentences are split into words when they are written, see
+        # get_report_statistics
+        statistics['sentences'] = analysis['sentences']
+        statistics['only_lengths'] = analysis['sentence_lengths']
+    statistics['shortest_sentence'] = shortest_sentence
+    statistics['shortest_sentence_str'] = shortest_sentence_str
+    statistics['longest_sentence'] = longest_sentence
+    statistics['longest_sentence_str'] = longest_sentence_str
+    statistics['avg_words_per_sentence'] = avg_words_per_sentence
+
+    return statistics
+
+
+# Count how many times each length appears in a list of lengths, sorted by
+# length
+def count_lengths(lengths):
+    length_counts = {}
+    for length in lengths:
+        if length in length_counts:
+            length_counts[length] += 1
+        else:
+            length_counts[length] = 1
+    return dict(sorted(length_counts.items()))
+
+
+# Character Analysis:
+# • Letter frequency distribution
+# • Punctuation statistics
+# • Case distribution (uppercase vs lowercase)
+# Bar chart of most common letters + pie chart of character types
+def finish_character_analysis(analysis):
+    sentence_stoppers = ['.', '?', '!']
+    letter_counts = {}
+    punctuation_counts = {}
+    total_upper = 0
+    total_lower = 0
+    total_digits = 0
+    total_spaces = 0
+    total_chars = 0
+
+    # Classify each different character
+    for char, count in analysis['char_counts'].items():
+        total_chars += count
+        if char.isalpha():
+            if letter_counts.get(char.lower()):
+                letter_counts[char.lower()] += count
+            else:
+                letter_counts[char.lower()] = count
+            if char.isupper():
+                total_upper += count
+            else:
+                total_lower += count
+        elif char.isdigit():
+            total_digits += count
+        elif char.isspace():
+            total_spaces += count
+        elif char in sentence_stoppers:
+            if punctuation_counts.get(char):
+                punctuation_counts[char] += count
+            else:
+                punctuation_counts[char] = count
+
+    # Extract most common letters
+    sorted_letters = top_k(
+        letter_counts, analysis['options'].get('top_letters', 12)
+    )
+
+    total_letters = sum(letter_counts.values())
+    total_punct = sum(punctuation_counts.values())
+    # Any other chars (like %&¤ etc)
+    other_chars = total_chars - (
+        total_letters + total_punct + total_digits + total_spaces
+    )
+
+    # Package data
+    statistics = {}
+    statistics['total_letters'] = total_letters
+    statistics['letter_counts'] = letter_counts
+    statistics['punctuation_counts'] = punctuation_counts
+    statistics['total_upper'] = total_upper
+    statistics['total_lower'] = total_lower
+    statistics['total_digits'] = total_digits
+    statistics['total_spaces'] = total_spaces
+    statistics['total_chars'] = total_chars
+    statistics['total_punctuations'] = total_punct
+    statistics['other_chars'] = other_chars
+
+    return statistics, sorted_letters
+
+
+# Directory where analysis results are cached between sessions
+CACHE_DIR = os.environ.get(
+    'TEXT_ANALYSIS_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'text_analysis')
+)
+# Least recently used results are removed when the cache grows above this
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Changed when cached results or resume points change shape, entries of
+# other versions are then not used and evicted like old entries
+CACHE_VERSION = 4
+# Bytes hashed from the start, middle and end of a file for its fingerprint
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+
+# Fingerprint of a file: path, size, modification time and a fast hash of
+# the content
+def file_fingerprint(file):
+    path = os.path.abspath(file)
+    file_stat = os.stat(path)
+    with open(path, 'rb') as file_stream:
+        content_hash = hash_file_samples(file_stream, file_stat.st_size)
+    return (path, file_stat.st_size, file_stat.st_mtime_ns, content_hash)
+
+
+# Hash of the first size bytes of an open file. Small files are hashed
+# completely, larger files are sampled at the start, middle and end
+def hash_file_samples(file_stream, size):
+    content_hash = hashlib.blake2b(digest_size=16)
+    if size <= FINGERPRINT_SAMPLE_SIZE * 3:
+        file_stream.seek(0)
+        content_hash.update(file_stream.read(size))
+    else:
+        for offset in (
+            0,
+            (size - FINGERPRINT_SAMPLE_SIZE) // 2,
+            size - FINGERPRINT_SAMPLE_SIZE
+        ):
+            file_stream.seek(offset)
+            content_hash.update(file_stream.read(FINGERPRINT_SAMPLE_SIZE))
+    return content_hash.hexdigest()
+
+
+# Path of the cache entry for a file analysed with some options (one entry
+# per file path and options)
+def get_cache_path(file, options=None):
+    path_hash = hashlib.sha1(os.path.abspath(file).encode('utf-8'))
+    options_hash = hashlib.sha1(
+        f'{CACHE_VERSION}:{get_options_key(options)}'.encode('utf-8')
+    )
+    return os.path.join(
+        CACHE_DIR,
+        f'{path_hash.hexdigest()}-{options_hash.hexdigest()[:16]}.pickle'
+    )
+
+
+# Analysis options as a string that is the same for equal options
+def get_options_key(options):
+    return repr(sorted((options or {}).items()))
+
+
+# Read the cache entry of a file from disk: its fingerprint, results and
+# resume point, None if there is no entry
+def load_cache_entry(file, options=None):
+    cache_path = get_cache_path(file, options)
+    try:
+        with open(cache_path, 'rb') as file_stream:
+            fingerprint, results, resume_point = pickle.load(file_stream)
+        return fingerprint, results, resume_point
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Broken cache entry, analyse the file again
+        return None
+
+
+# Write results and the resume point of a file to the disk cache and evict
+# old entries
+def save_cached_analysis(
+    fingerprint, results, resume_point=None, options=None
+):
+    cache_path = get_cache_path(fingerprint[0], options)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temporary file first so a cancelled write never leaves
+        # a broken entry behind
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file_stream:
+            pickle.dump(
+                (fingerprint, results, resume_point), file_stream,
+                pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temp_path, cache_path)
+        evict_cached_analyses()
+    except Exception as e:
+        print(f'Could not write analysis cache: {e}')
+
+
+# Remove least recently used entries until the cache fits in CACHE_MAX_BYTES
+def evict_cached_analyses(max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    total_size = 0
+    for name in os.listdir(CACHE_DIR):
+        if (
+            name.endswith('.pickle') or name.endswith('.index')
+            or name.endswith('.tokens')
+        ):
+            path = os.path.join(CACHE_DIR, name)
+            entry_stat = os.stat(path)
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, path))
+            total_size += entry_stat.st_size
+
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= max_bytes:
+            break
+        os.remove(path)
+        total_size -= size
+
+
+# Remove the cached results of one file for all options, from memory and
+# disk
+def invalidate_cached_analysis(file, state=None):
+    path = os.path.abspath(file)
+    if state is not None:
+        memory_cache = state.get('analysis_cache', {})
+        for key in list(memory_cache):
+            if key[0] == path:
+                del memory_cache[key]
+        state.get('index_cache', {}).pop(path, None)
+        state.get('tokens_cache', {}).pop(path, None)
+    if os.path.isdir(CACHE_DIR):
+        prefix = os.path.basename(get_cache_path(file)).split('-')[0] + '-'
+        for name in os.listdir(CACHE_DIR):
+            if name.startswith(prefix):
+                os.remove(os.path.join(CACHE_DIR, name))
+
+
+# Remove all cached results, word indexes and token streams, from memory and
+# disk
+def clear_analysis_cache(state=None):
+    if state is not None:
+        state['analysis_cache'] = {}
+        state['index_cache'] = {}
+        state['tokens_cache'] = {}
+    if os.path.isdir(CACHE_DIR):
+        for name in os.listdir(CACHE_DIR):
+            if (
+                name.endswith('.pickle') or name.endswith('.index')
+                or name.endswith('.tokens') or name.endswith('.tmp')
+            ):
+                os.remove(os.path.join(CACHE_DIR, name))
+
+
+# Get analysis results of a file, from the in-memory cache in state, the disk
+# cache or by analysing the file. A changed file gets a new fingerprint, so
+# old results are never returned for it, but a file that was only appended to
+# is analysed from where the last analysis stopped.
+# use_cache=False always analyses the whole file.
+# Uses state['workers'] processes for large files and state['options'] as
+# analysis options unless workers or options are given
+def get_analysis(
+    file, state=None, use_cache=True, workers=None, options=None
+):
+    if state is None:
+        state = {}
+    if workers is None:
+        workers = state.get('workers', 1)
+    if options is None:
+        options = state.get('options', {})
+    # Results exported in the binary format are loaded instead of analysed
+    if file.endswith(BINARY_EXTENSION):
+        try:
+            return load_binary_results(file)
+        except Exception as e:
+            print(f'Unknown error reading file: {e}')
+            analysis = new_analysis(options)
+            analysis['error'] = str(e)
+            return finish_analysis(analysis)
+    if not use_cache:
+        return analyse_file(file, workers, options)
+
+    try:
+        fingerprint = file_fingerprint(file)
+    except OSError:
+        # Let the analysis report the error
+        return analyse_file(file, workers, options)
+
+    memory_cache = state.setdefault('analysis_cache', {})
+    memory_key = (fingerprint[0], get_options_key(options))
+    started = time.perf_counter()
+    cached = memory_cache.get(memory_key)
+    if cached is not None and cached[0] == fingerprint:
+        return add_timings(cached[1], None, started)
+
+    timings = None
+    entry = load_cache_entry(file, options)
+    if entry is not None and entry[0] == fingerprint:
+        # Mark entry as recently used
+        os.utime(get_cache_path(file, options))
+        results = entry[1]
+    else:
+        resume_point = None
+        if entry is not None:
+            resume_point = entry[2]
+        results, resume_point = analyse_file_incremental(
+            file, workers, resume_point, options
+        )
+        # Don't keep results of files that could not be read completely
+        if results['error'] is not None:
+            return results
+        # Timings only belong to this run and are not cached
+        timings = results.pop('timings', None)
+        save_cached_analysis(fingerprint, results, resume_point, options)
+    memory_cache[memory_key] = (fingerprint, results)
+    return add_timings(results, timings, started)
+
+
+# Copy of results with the timings of this run when profiling. Results that
+# came from the cache get a single cache stage timed from started
+def add_timings(results, timings, started):
+    if not PROFILE:
+        return results
+    if timings is None:
+        timings = {}
+        add_to_profile(timings, 'cache', started)
+    results = dict(results)
+    results['timings'] = timings
+    return results
+
+
+# Views over the analysis engine, each returns the same data as the separate
+# analysis it is named after
+def get_basic_statistics(file, use_cache=True, workers=1, options=None):
+    return get_analysis(
+        file, use_cache=use_cache, workers=workers, options=options
+    )['basic_statistics']
+
+
+def word_analysis(file, use_cache=True, workers=1, options=None):
+    statistics, top_10_words, unique_words = get_analysis(
+        file, use_cache=use_cache, workers=workers, options=options
+    )['word_analysis']
+    return expand_statistics(statistics), top_10_words, unique_words
+
+
+def sentence_analysis(file, use_cache=True, workers=1, options=None):
+    return expand_statistics(get_analysis(
+        file, use_cache=use_cache, workers=workers, options=options
+    )['sentence_analysis'])
+
+
+# Statistics with lists instead of the arrays and sentences kept in the
+# results, like the separate analyses returned them
+def expand_statistics(statistics):
+    expanded = {}
+    for key, value in get_report_statistics(statistics).items():
+        if is_report_list(value):
+            value = list(value)
+        expanded[key] = value
+    return expanded
+
+
+def character_analysis(file, use_cache=True, workers=1, options=None):
+    return get_analysis(
+        file, use_cache=use_cache, workers=workers, options=options
+    )['character_analysis']
+
+
+def calculate_lix(file, use_cache=True, workers=1, options=None):
+    return get_analysis(
+        file, use_cache=use_cache, workers=workers, options=options
+    )['lix']
+
+
+# Inverted index for keyword in context (KWIC) search, stored in CACHE_DIR
+# and used until the file changes. Every word (normalized by tokenize, like
+# in word analysis) maps to the lines it appears on. A line is stored as the
+# difference to the previous line number and byte offset of the word, as
+# variable length integers, so common words take about 2 bytes per line.
+# File layout: 'TXTI', version (uint16), position of the header (uint64),
+# the encoded lines of every word and the header, a pickle of the file
+# fingerprint, amount of lines, encoding of the lines and
+# {word: (position, length, lines)}
+INDEX_MAGIC = b'TXTI'
+INDEX_VERSION = 2
+
+
+# Path of the index of a file, removed with the cached analyses of the file
+def get_index_path(file):
+    path_hash = hashlib.sha1(os.path.abspath(file).encode('utf-8'))
+    return os.path.join(CACHE_DIR, f'{path_hash.hexdigest()}-words.index')
+
+
+# Unsigned integers as variable length integers, 7 bits per byte
+def append_varint(data, value):
+    while value >= 0x80:
+        data.append((value & 0x7F) | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def decode_varints(data):
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+    return values
+
+
+# Read a file once and write its index. Returns the index header
+def build_index(file):
+    fingerprint = file_fingerprint(file)
+    # Lines are decoded with the encoding the analysis detects. Only parts
+    # of a file are sampled, so ASCII files are read as UTF-8
+    encoding = detect_encoding(file)
+    if encoding == 'ascii':
+        encoding = 'utf-8'
+    # {word: encoded line delta, offset delta, line delta, ...}, the deltas
+    # are encoded as the file is read
+    postings = {}
+    # {word: (last line, its offset, amount of lines)}
+    last_positions = {}
+    line_number = 0
+    offset = 0
+    with open_binary(file) as file_stream:
+        for line in file_stream:
+            for word in set(tokenize(line.decode(encoding, 'replace'))):
+                last_position = last_positions.get(word)
+                if last_position is None:
+                    data = postings[word] = bytearray()
+                    append_varint(data, line_number)
+                    append_varint(data, offset)
+                    last_positions[word] = (line_number, offset, 1)
+                else:
+                    data = postings[word]
+                    append_varint(data, line_number - last_position[0])
+                    append_varint(data, offset - last_position[1])
+                    last_positions[word] = (
+                        line_number, offset, last_position[2] + 1
+                    )
+            line_number += 1
+            offset += len(line)
+
+    header = {}
+    header['fingerprint'] = fingerprint
+    header['lines'] = line_number
+    header['encoding'] = encoding
+    header['words'] = {}
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    index_path = get_index_path(file)
+    temp_path = f'{index_path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as file_stream:
+        file_stream.write(INDEX_MAGIC + struct.pack('<HQ', INDEX_VERSION, 0))
+        for word, data in postings.items():
+            header['words'][word] = (
+                file_stream.tell(), len(data), last_positions[word][2]
+            )
+            file_stream.write(data)
+        header_position = file_stream.tell()
+        pickle.dump(header, file_stream, pickle.HIGHEST_PROTOCOL)
+        file_stream.seek(len(INDEX_MAGIC))
+        file_stream.write(struct.pack('<HQ', INDEX_VERSION, header_position))
+    os.replace(temp_path, index_path)
+    return header
+
+
+# Header of the index of a file if there is one for its current content,
+# otherwise None
+def load_index(file):
+    try:
+        with open(get_index_path(file), 'rb') as file_stream:
+            if file_stream.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                return None
+            version, header_position = struct.unpack(
+                '<HQ', file_stream.read(10)
+            )
+            if version != INDEX_VERSION:
+                return None
+            file_stream.seek(header_position)
+            header = pickle.load(file_stream)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Broken index, build it again
+        return None
+    if header['fingerprint'] != file_fingerprint(file):
+        return None
+    return header
+
+
+# Index of a file: kept in state between searches, loaded from disk or
+# built if the file changed since it was indexed
+def get_index(file, state=None):
+    if state is None:
+        state = {}
+    index_cache = state.setdefault('index_cache', {})
+    path = os.path.abspath(file)
+    header = index_cache.get(path)
+    if header is None or header['fingerprint'] != file_fingerprint(file):
+        header = load_index(file)
+        if header is None:
+            header = build_index(file)
+        index_cache[path] = header
+    return header
+
+
+# Line numbers (from 0) and byte offsets of the lines a word appears on
+def find_word_lines(file, word, state=None):
+    header = get_index(file, state)
+    entry = header['words'].get(word)
+    if entry is None:
+        return []
+    position, length, line_count = entry
+    with open(get_index_path(file), 'rb') as file_stream:
+        file_stream.seek(position)
+        deltas = decode_varints(file_stream.read(length))
+    lines = []
+    line_number = 0
+    offset = 0
+    for i in range(0, len(deltas), 2):
+        line_number += deltas[i]
+        offset += deltas[i + 1]
+        lines.append((line_number, offset))
+    return lines
+
+
+# Keyword in context: every place a word appears, as dictionaries with the
+# line number (from 1), the byte offset of the line and the text around the
+# word (width characters on each side). The word is normalized like in word
+# analysis, so 'Achilles' also finds "achilles'". Only the lines with the
+# word are read from the file. At most limit results unless limit is None
+def search_word(file, word, width=40, limit=None, state=None):
+    words = tokenize(word)
+    if len(words) != 1:
+        raise ValueError('Search for exactly one word')
+    word = words[0]
+    if state is None:
+        state = {}
+    encoding = get_index(file, state)['encoding']
+
+    concordance = []
+    # Lines are read in file order, so a compressed file is only
+    # decompressed once
+    with open_binary(file) as file_stream:
+        for line_number, offset in find_word_lines(file, word, state):
+            file_stream.seek(offset)
+            line = file_stream.readline().decode(encoding, 'replace')
+            line = line.rstrip('\r\n')
+            for match in re.finditer(r'\S+', line):
+                if ''.join(tokenize(match.group())) != word:
+                    continue
+                left_start = max(match.start() - width, 0)
+                entry = {}
+                entry['line'] = line_number + 1
+                entry['offset'] = offset
+                entry['left'] = line[left_start:match.start()]
+                entry['keyword'] = match.group()
+                entry['right'] = line[match.end():match.end() + width]
+                concordance.append(entry)
+                if limit is not None and len(concordance) >= limit:
+                    return concordance
+    return concordance
+
+
+# Amount of occurrences the menu prints
+KWIC_MENU_LIMIT = 25
+
+
+# Print a concordance with the keywords lined up
+def print_concordance(concordance, width=40):
+    for entry in concordance:
+        print(
+            f"{entry['line']:>7}: {entry['left']:>{width}} "
+            f"[{entry['keyword']}] {entry['right']}"
+        )
+
+
+# Vocabulary and token stream of the analysis engine (see new_vocabulary),
+# stored in CACHE_DIR next to the word index and used until the file
+# changes. get_analysis writes it when it analyses a file with exact word
+# counts and without streaming, so n-grams of other sizes can be counted
+# from the IDs instead of reading and tokenizing the text again.
+# File layout: 'TXTT', version (uint16), position of the header (uint64),
+# the IDs (little-endian uint32) and the header, a pickle of the file
+# fingerprint and the vocabulary as a list of words
+TOKENS_MAGIC = b'TXTT'
+TOKENS_VERSION = 1
+
+
+# Path of the token stream of a file, removed with the cached analyses of the
+# file
+def get_tokens_path(file):
+    path_hash = hashlib.sha1(os.path.abspath(file).encode('utf-8'))
+    return os.path.join(CACHE_DIR, f'{path_hash.hexdigest()}-words.tokens')
+
+
+# Vocabulary and IDs of the token stream of a file if there is one for its
+# current content, otherwise None
+def load_token_stream(file):
+    try:
+        with open(get_tokens_path(file), 'rb') as file_stream:
+            if file_stream.read(len(TOKENS_MAGIC)) != TOKENS_MAGIC:
+                return None
+            version, header_position = struct.unpack(
+                '<HQ', file_stream.read(10)
+            )
+            if version != TOKENS_VERSION:
+                return None
+            file_stream.seek(header_position)
+            header = pickle.load(file_stream)
+            if header['fingerprint'] != file_fingerprint(file):
+                return None
+            file_stream.seek(len(TOKENS_MAGIC) + 10)
+            tokens = array.array('I')
+            tokens.frombytes(read_exactly(
+                file_stream, header_position - len(TOKENS_MAGIC) - 10
+            ))
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Broken token stream, build it again
+        return None
+    if sys.byteorder == 'big':
+        tokens.byteswap()
+    vocabulary = new_vocabulary()
+    vocabulary['words'] = header['vocabulary']
+    for i in range(0, len(vocabulary['words']), 1):
+        vocabulary['ids'][vocabulary['words'][i]] = i
+    return vocabulary, tokens
+
+
+# Write the vocabulary and token stream of an analysed file
+def save_token_stream(file, vocabulary, tokens):
+    header = {}
+    header['fingerprint'] = file_fingerprint(file)
+    header['vocabulary'] = vocabulary['words']
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tokens_path = get_tokens_path(file)
+    temp_path = f'{tokens_path}.{os.getpid()}.tmp'
+    # write_binary_array byteswaps the array it writes on big-endian
+    # machines, the tokens of the analysis are kept as they are
+    if sys.byteorder == 'big':
+        tokens = array.array('I', tokens)
+    with open(temp_path, 'wb') as file_stream:
+        file_stream.write(
+            TOKENS_MAGIC + struct.pack('<HQ', TOKENS_VERSION, 0)
+        )
+        write_binary_array(file_stream, tokens)
+        header_position = file_stream.tell()
+        pickle.dump(header, file_stream, pickle.HIGHEST_PROTOCOL)
+        file_stream.seek(len(TOKENS_MAGIC))
+        file_stream.write(
+            struct.pack('<HQ', TOKENS_VERSION, header_position)
+        )
+    os.replace(temp_path, tokens_path)
+    evict_cached_analyses()
+
+
+# Token stream of a file: kept in state between analyses, loaded from disk
+# or made by analysing the file if it changed since it was tokenized
+def get_token_stream(file, state=None):
+    if state is None:
+        state = {}
+    tokens_cache = state.setdefault('tokens_cache', {})
+    fingerprint = file_fingerprint(file)
+    cached = tokens_cache.get(fingerprint[0])
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    token_stream = load_token_stream(file)
+    if token_stream is None:
+        analysis = analyse_file_part(file, 0, None, state.get('workers', 1))
+        if analysis['error'] is not None:
+            raise ValueError(analysis['error'])
+        token_stream = (analysis['vocabulary'], analysis['tokens'])
+        save_token_stream(file, *token_stream)
+    tokens_cache[fingerprint[0]] = (fingerprint, token_stream)
+    return token_stream
+
+
+# N-gram analysis of a file from its token stream, without reading the text
+# again. Takes the same options as analyse_file (ngram_size is needed) and
+# returns the same ngram_analysis results. The n-grams are counted as tuples
+# of IDs, the words are only looked up for the n-grams that are kept
+def analyse_token_ngrams(file, options=None, state=None):
+    analysis = new_analysis(options)
+    ngrams = analysis['ngrams']
+    if ngrams is None:
+        raise ValueError('The ngram_size option is needed')
+    vocabulary, tokens = get_token_stream(file, state)
+    words = vocabulary['words']
+
+    stopwords = set()
+    for word in ngrams['stopwords']:
+        if word in vocabulary['ids']:
+            stopwords.add(vocabulary['ids'][word])
+    # A block at a time, each block starts with the last n - 1 IDs of the
+    # previous one so the n-grams between them are counted
+    for start in range(0, len(tokens), READ_SIZE):
+        block_start = max(start - ngrams['size'] + 1, 0)
+        add_to_heavy_hitters(
+            ngrams['heavy_hitters'],
+            get_ngrams(
+                tokens[block_start:start + READ_SIZE], ngrams['size'],
+                stopwords
+            )
+        )
+    id_ngram_counts = ngrams['heavy_hitters']['counts']
+    ngrams['heavy_hitters']['counts'] = Counter()
+    for ngram, count in id_ngram_counts.items():
+        ngrams['heavy_hitters']['counts'][
+            tuple(map(words.__getitem__, ngram))
+        ] = count
+
+    results = {}
+    results['options'] = analysis['options']
+    results['ngram_analysis'] = finish_ngram_analysis(analysis)
+    return results
+
+
+# binary_export writes the compact binary results format instead, which can
+# be loaded again to draw the charts without analysing the file
+def export_statistics(
+    file_to_analyse, comprehensive=False, json_export=False, state=None,
+    binary_export=False
+):
+    cwd = os.getcwd()
+    file_name = ''
+
+    print('Exporting...')
+
+    # Read the file once for all analyses
+    results = get_analysis(file_to_analyse, state)
+
+    if comprehensive:
+        file_name = 'comprehensive_export'
+    else:
+        file_name = 'normal_export'
+
+    if binary_export:
+        file_name = 'results_export' + BINARY_EXTENSION
+    elif json_export:
+        file_name += '.json'
+    else:
+        file_name += '.txt'
+
+    if os.path.exists(cwd + '/' + file_name):
+        print(
+            f'Prevented overwriting. {file_name} already exists, please '
+            'rename or remove it.'
+        )
+        return
+
+    started = time.perf_counter()
+    try:
+        if binary_export:
+            with open(file_name, 'wb') as file_stream:
+                write_binary_results(file_stream, results)
+        else:
+            with open(file_name, 'w', encoding='utf-8') as file_stream:
+                if json_export:
+                    write_json_report(file_stream, results, comprehensive)
+                else:
+                    write_text_report(file_stream, results, comprehensive)
+    except Exception as e:
+        if binary_export:
+            print(f'Error exporting binary file: {e}')
+        elif json_export:
+            print(f'Error exporting JSON: {e}')
+        else:
+            print(f'Error exporting text file: {e}')
+        return
+
+    print(f'Export successful, {file_name} created in current directory.')
+    if 'timings' in results:
+        add_to_profile(results['timings'], 'write_report', started)
+        print()
+        print_profile(results['timings'])
+    return
+
+
+# Sentences of a report as (amount of words, words) pairs, split one at a
+# time while the report is written
+def iter_sentence_lengths(sentences):
+    for sentence in sentences:
+        words = sentence.split()
+        yield len(words), words
+
+
+# Statistics as they are written to reports. The results keep the text of
+# every sentence, reports list them as sentence_lengths
+def get_report_statistics(statistics):
+    report_statistics = {}
+    for key, value in statistics.items():
+        if key == 'sentences':
+            report_statistics['sentence_lengths'] = iter_sentence_lengths(
+                value
+            )
+        else:
+            report_statistics[key] = value
+    return report_statistics
+
+
+# Write a value of a text report as str() writes it, lists with one entry
+# per word or sentence a batch at a time
+def write_text_value(file_stream, value):
+    if not is_report_list(value) or isinstance(value, (list, tuple)):
+        file_stream.write(str(value))
+        return
+    file_stream.write('[')
+    first = True
+    for batch in iter_batches(value, JSON_BATCH_SIZE):
+        if not first:
+            file_stream.write(', ')
+        first = False
+        file_stream.write(', '.join(map(repr, batch)))
+    file_stream.write(']')
+
+
+# Keys left out of normal (not comprehensive) reports
+NORMAL_REPORT_EXCLUDED_WORD_KEYS = (
+    'word_lengths_unique', 'word_lengths_duplicates',
+    'unique_word_length_counts', 'word_length_counts'
+)
+NORMAL_REPORT_EXCLUDED_SENTENCE_KEYS = (
+    'sentence_lengths', 'only_lengths', 'sentence_length_counts',
+    'longest_sentence', 'shortest_sentence'
+)
+
+
+# Write analysis results as a text report
+def write_text_report(file_stream, results, comprehensive=False):
+    basic_statistics = results['basic_statistics']
+    word_analysis_stats, top_words, unique_words = results['word_analysis']
+    sentence_analysis_statistics = get_report_statistics(
+        results['sentence_analysis']
+    )
+    char_analysis_stats, sorted_letters = results['character_analysis']
+    lix = results['lix']
+    top_words_amount = results['options'].get('top_words', 10)
+    top_letters_amount = results['options'].get('top_letters', 12)
+
+    file_stream.write('===== Basic Statistics =====\n')
+    for key in basic_statistics.keys():
+        file_stream.write(f'{key} : {basic_statistics[key]}\n')
+    file_stream.write(f'LIX: {str(lix)}')
+
+    file_stream.write('\n===== Word Analysis =====\n')
+    for key in word_analysis_stats.keys():
+        # Don't include these in simple report
+        if comprehensive or key not in NORMAL_REPORT_EXCLUDED_WORD_KEYS:
+            file_stream.write(f'{key} : ')
+            write_text_value(file_stream, word_analysis_stats[key])
+            file_stream.write('\n')
+    file_stream.write(f'----- Top {top_words_amount} words -----\n')
+    for key in top_words.keys():
+        file_stream.write(f'{key} appears {top_words[key]} times\n')
+    if comprehensive:
+        file_stream.write('----- List of unique words -----\n')
+        for word in unique_words:
+            file_stream.write(f'{word}, ')
+
+    file_stream.write('\n\n===== Sentence Analysis =====\n')
+    for key in sentence_analysis_statistics.keys():
+        # Don't include these in simple report
+        if (
+            comprehensive
+            or key not in NORMAL_REPORT_EXCLUDED_SENTENCE_KEYS
+        ):
+            file_stream.write(f'{key} : ')
+            write_text_value(file_stream, sentence_analysis_statistics[key])
+            file_stream.write('\n')
+
+    file_stream.write('\n===== Character Analysis =====\n')
+    for key in char_analysis_stats.keys():
+        file_stream.write(f'{key} : {char_analysis_stats[key]}\n')
+    file_stream.write(f'----- Top {top_letters_amount} Letters -----\n')
+    for letter in sorted_letters.keys():
+        file_stream.write(
+            f'{letter} appears {sorted_letters[letter]} times\n'
+        )
+
+    # Only when n-grams were counted
+    if 'ngram_analysis' in results:
+        ngram_statistics, top_ngrams = results['ngram_analysis']
+        top_ngrams_amount = results['options'].get('top_ngrams', 10)
+        file_stream.write('\n===== N-gram Analysis =====\n')
+        for key in ngram_statistics.keys():
+            file_stream.write(f'{key} : {ngram_statistics[key]}\n')
+        file_stream.write(f'----- Top {top_ngrams_amount} n-grams -----\n')
+        for ngram in top_ngrams.keys():
+            file_stream.write(f'{ngram} appears {top_ngrams[ngram]} times\n')
+
+    # Only when a readability profile was made
+    if 'readability_profile' in results:
+        write_readability_profile(file_stream, results['readability_profile'])
+
+    # Only when the file isn't plain UTF-8
+    if has_encoding_report(results):
+        file_stream.write('\n===== Encoding =====\n')
+        for key, value in results['encoding'].items():
+            file_stream.write(f'{key} : {value}\n')
+
+
+# Readability profile of a text report, a table with a row per window
+def write_readability_profile(file_stream, profile):
+    if profile['unit'] == 'chapters':
+        file_stream.write('\n===== Readability per chapter =====\n')
+    else:
+        file_stream.write(
+            f"\n===== Readability per {profile['window']} "
+            f"{profile['unit']} =====\n"
+        )
+    file_stream.write(
+        'start_word : sentences, words, LIX, avg_sentence_length, '
+        'long_words_percent\n'
+    )
+    for i in range(0, len(profile['lix']), 1):
+        file_stream.write(
+            f"{profile['start_word'][i]} : {profile['sentences'][i]}, "
+            f"{profile['words'][i]}, {profile['lix'][i]}, "
+            f"{profile['avg_sentence_length'][i]}, "
+            f"{profile['long_words_percent'][i]}\n"
+        )
+
+
+# Analysis results as the dictionary written to JSON reports
+def get_json_report(results, comprehensive=False):
+    word_analysis_stats, top_words, unique_words = results['word_analysis']
+    sentence_analysis_statistics = get_report_statistics(
+        results['sentence_analysis']
+    )
+    char_analysis_stats, sorted_letters = results['character_analysis']
+
+    if not comprehensive:
+        word_analysis_stats_filtered = {}
+        sentence_analysis_statistics_filtered = {}
+        for key in word_analysis_stats:
+            if key not in NORMAL_REPORT_EXCLUDED_WORD_KEYS:
+                word_analysis_stats_filtered[key] = word_analysis_stats[key]
+        for key in sentence_analysis_statistics:
+            if key not in NORMAL_REPORT_EXCLUDED_SENTENCE_KEYS:
+                sentence_analysis_statistics_filtered[key] = (
+                    sentence_analysis_statistics[key]
+                )
+        word_analysis_stats = word_analysis_stats_filtered
+        sentence_analysis_statistics = sentence_analysis_statistics_filtered
+
+    json_export_dict = {}
+    json_export_dict['basic_statistics'] = results['basic_statistics']
+    json_export_dict['LIX_score'] = results['lix']
+    json_export_dict['word_analysis'] = word_analysis_stats
+    json_export_dict['top_10_words'] = top_words
+    json_export_dict['sentence_stats'] = sentence_analysis_statistics
+    json_export_dict['char_stats'] = char_analysis_stats
+    json_export_dict['sorted_letters'] = sorted_letters
+    # Only when n-grams were counted
+    if 'ngram_analysis' in results:
+        json_export_dict['ngram_stats'] = results['ngram_analysis'][0]
+        json_export_dict['top_ngrams'] = results['ngram_analysis'][1]
+    # Only when a readability profile was made
+    if 'readability_profile' in results:
+        json_export_dict['readability_profile'] = (
+            results['readability_profile']
+        )
+    # Only when the file isn't plain UTF-8
+    if has_encoding_report(results):
+        json_export_dict['encoding'] = results['encoding']
+    # Only when profiling
+    if 'timings' in results:
+        json_export_dict['timings'] = results['timings']
+    return json_export_dict
+
+
+# Styles of JSON reports:
+# indent: indented with 4 spaces, like json.dump(indent=4)
+# compact: without any whitespace
+# ndjson: one line per section, {"section": value}, the sections of all
+#   lines together are the same report
+JSON_STYLES = ('indent', 'compact', 'ndjson')
+
+
+# Amount of list items encoded at a time by write_json_value
+JSON_BATCH_SIZE = 10000
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False)
+JSON_COMPACT_ENCODER = json.JSONEncoder(
+    ensure_ascii=False, separators=(',', ':')
+)
+
+
+# Write analysis results as a JSON report, one section at a time so the
+# whole report never has to be in memory as one string
+def write_json_report(
+    file_stream, results, comprehensive=False, style='indent'
+):
+    if style not in JSON_STYLES:
+        raise ValueError(f'Unknown JSON style: {style}')
+    report = get_json_report(results, comprehensive)
+
+    if style == 'ndjson':
+        for key, value in report.items():
+            file_stream.write('{' + JSON_ENCODER.encode(key) + ':')
+            write_json_value(file_stream, value)
+            file_stream.write('}\n')
+    elif style == 'compact':
+        write_json_value(file_stream, report)
+    else:
+        write_json_value(file_stream, report, indent=4)
+
+
+# Write a value as JSON, the same text json.dump writes with the same indent
+# (or compact separators when indent is None). Dictionaries are written item
+# by item and lists, arrays and generators JSON_BATCH_SIZE items at a time
+def write_json_value(file_stream, value, indent=None, level=0):
+    if isinstance(value, dict):
+        opening, closing = '{', '}'
+        if len(value) == 0:
+            file_stream.write('{}')
+            return
+    elif is_report_list(value):
+        opening, closing = '[', ']'
+        batches = iter_batches(value, JSON_BATCH_SIZE)
+        batch = next(batches, None)
+        if batch is None:
+            file_stream.write('[]')
+            return
+    else:
+        file_stream.write(JSON_ENCODER.encode(value))
+        return
+
+    if indent is None:
+        newline = ''
+        closing_newline = ''
+        key_separator = ':'
+    else:
+        newline = '\n' + ' ' * (indent * (level + 1))
+        closing_newline = '\n' + ' ' * (indent * level)
+        key_separator = ': '
+    item_separator = ',' + newline
+    file_stream.write(opening + newline)
+
+    if isinstance(value, dict):
+        first = True
+        for key, item in value.items():
+            if not first:
+                file_stream.write(item_separator)
+            first = False
+            # JSON keys are strings, other keys are converted like json does
+            if not isinstance(key, str):
+                key = JSON_ENCODER.encode(key)
+            file_stream.write(JSON_ENCODER.encode(key) + key_separator)
+            write_json_value(file_stream, item, indent, level + 1)
+    else:
+        if indent is not None:
+            indent_encoder = json.JSONEncoder(
+                ensure_ascii=False, indent=indent
+            )
+        first = True
+        while batch is not None:
+            if not first:
+                file_stream.write(item_separator)
+            first = False
+            if indent is None:
+                file_stream.write(JSON_COMPACT_ENCODER.encode(batch)[1:-1])
+            else:
+                # Encode the batch as a list without its brackets and move
+                # it to this level. Strings in JSON never contain newlines,
+                # so only the indentation is changed
+                text = indent_encoder.encode(batch)[2 + indent:-2]
+                file_stream.write(text.replace('\n', closing_newline))
+            batch = next(batches, None)
+    file_stream.write(closing_newline + closing)
+
+
+# Lists with one entry per word or sentence are kept as arrays in the results
+# and sentence_lengths is made while it is written, see
+# get_report_statistics. Both are written like lists
+def is_report_list(value):
+    return isinstance(value, (list, tuple, array.array)) or (
+        hasattr(value, '__next__')
+    )
+
+
+# Items of a list, array or generator as lists of at most size items
+def iter_batches(values, size):
+    if hasattr(values, '__next__'):
+        while True:
+            batch = list(itertools.islice(values, size))
+            if len(batch) == 0:
+                return
+            yield batch
+    else:
+        for start in range(0, len(values), size):
+            batch = values[start:start + size]
+            if isinstance(batch, array.array):
+                batch = batch.tolist()
+            yield batch
+
+
+# Arrays and generators of a report as lists, for json.dumps(default=...)
+def json_default(value):
+    if is_report_list(value):
+        return list(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+# Compact binary results format, for archiving results and drawing charts
+# again without analysing the file:
+# 'TXTA', version (uint16), length of the statistics JSON (uint32), the
+# statistics that aren't count tables as JSON, amount of tables (uint32) and
+# the tables. A table is its name (uint16 length + UTF-8), kind (b'S' for
+# text keys, b'I' for integer keys), amount of entries and length of the key
+# text (uint64 each), then the key lengths (S) or keys (I), the UTF-8 keys
+# (S) and the counts as little-endian int64 arrays.
+# Lists with one entry per word or sentence are stored as length
+# distributions like in streaming mode, sentence word lists are left out
+BINARY_MAGIC = b'TXTA'
+BINARY_VERSION = 1
+BINARY_EXTENSION = '.tabin'
+# Count tables of each section of the results
+BINARY_TABLES = {
+    'word_analysis': ('unique_word_length_counts', 'word_length_counts'),
+    'sentence_analysis': (
+        'top_10_sentence_lengths', 'sentence_length_counts'
+    ),
+    'character_analysis': ('letter_counts', 'punctuation_counts')
+}
+
+
+# Lists with one entry per word or sentence and the length distribution they
+# are stored as (None: not stored)
+BINARY_LENGTH_LISTS = {
+    'word_lengths_unique': 'unique_word_length_counts',
+    'word_lengths_duplicates': 'word_length_counts',
+    'only_lengths': 'sentence_length_counts',
+    'sentences': None
+}
+
+
+# Write analysis results in the binary results format
+def write_binary_results(file_stream, results):
+    word_statistics, top_words, unique_words = results['word_analysis']
+    char_statistics, sorted_letters = results['character_analysis']
+    sections = {}
+    sections['word_analysis'] = word_statistics
+    sections['sentence_analysis'] = results['sentence_analysis']
+    sections['character_analysis'] = char_statistics
+
+    tables = []
+    tables.append(('top_words', top_words))
+    tables.append(('sorted_letters', sorted_letters))
+    statistics = {}
+    statistics['error'] = results['error']
+    statistics['options'] = results['options']
+    statistics['lix'] = results['lix']
+    statistics['basic_statistics'] = results['basic_statistics']
+    if 'ngram_analysis' in results:
+        statistics['ngram_analysis'] = results['ngram_analysis'][0]
+        tables.append(('top_ngrams', results['ngram_analysis'][1]))
+    if 'encoding' in results:
+        statistics['encoding'] = results['encoding']
+    # The time series is already compact
+    if 'readability_profile' in results:
+        statistics['readability_profile'] = results['readability_profile']
+    for section, section_statistics in sections.items():
+        statistics[section] = {}
+        for key, value in section_statistics.items():
+            if key in BINARY_LENGTH_LISTS:
+                key = BINARY_LENGTH_LISTS[key]
+                if key is None:
+                    continue
+                value = count_lengths(value)
+            if key in BINARY_TABLES[section]:
+                tables.append((f'{section}.{key}', value))
+                # Filled in from the table when loaded
+                value = None
+            statistics[section][key] = value
+    statistics_data = json.dumps(statistics, ensure_ascii=False).encode(
+        'utf-8'
+    )
+
+    file_stream.write(BINARY_MAGIC)
+    file_stream.write(
+        struct.pack('<HI', BINARY_VERSION, len(statistics_data))
+    )
+    file_stream.write(statistics_data)
+    file_stream.write(struct.pack('<I', len(tables)))
+    for name, counts in tables:
+        write_binary_table(file_stream, name, counts)
+
+
+def write_binary_table(file_stream, name, counts):
+    keys = list(counts)
+    text_keys = True
+    for key in keys:
+        if not isinstance(key, str):
+            text_keys = False
+            break
+    if text_keys:
+        encoded_keys = []
+        for key in keys:
+            encoded_keys.append(key.encode('utf-8'))
+        key_data = b''.join(encoded_keys)
+        key_array = array.array('q', map(len, encoded_keys))
+    else:
+        key_data = b''
+        key_array = array.array('q', keys)
+
+    name_data = name.encode('utf-8')
+    file_stream.write(struct.pack('<H', len(name_data)) + name_data)
+    if text_keys:
+        file_stream.write(b'S')
+    else:
+        file_stream.write(b'I')
+    file_stream.write(struct.pack('<QQ', len(keys), len(key_data)))
+    write_binary_array(file_stream, key_array)
+    file_stream.write(key_data)
+    write_binary_array(file_stream, array.array('q', counts.values()))
+
+
+# Arrays are stored little-endian
+def write_binary_array(file_stream, values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    file_stream.write(values.tobytes())
+
+
+def read_binary_array(file_stream, length):
+    values = array.array('q')
+    values.frombytes(read_exactly(file_stream, length * values.itemsize))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def read_exactly(file_stream, size):
+    data = file_stream.read(size)
+    if len(data) != size:
+        raise ValueError('Binary results file is truncated')
+    return data
+
+
+# Load results written by write_binary_results. They have the same structure
+# as results of a streaming mode analysis, so they can be charted and
+# exported like any other results (without the list of unique words)
+def load_binary_results(file):
+    with open(file, 'rb') as file_stream:
+        if file_stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+            raise ValueError(f'{file} is not a binary results file')
+        version, statistics_length = struct.unpack(
+            '<HI', read_exactly(file_stream, 6)
+        )
+        if version != BINARY_VERSION:
+            raise ValueError(
+                f'Unsupported binary results version: {version}'
+            )
+        statistics = json.loads(
+            read_exactly(file_stream, statistics_length).decode('utf-8')
+        )
+
+        tables = {}
+        table_count = struct.unpack('<I', read_exactly(file_stream, 4))[0]
+        for i in range(0, table_count, 1):
+            name_length = struct.unpack('<H', read_exactly(file_stream, 2))[0]
+            name = read_exactly(file_stream, name_length).decode('utf-8')
+            kind = read_exactly(file_stream, 1)
+            length, key_data_length = struct.unpack(
+                '<QQ', read_exactly(file_stream, 16)
+            )
+            key_array = read_binary_array(file_stream, length)
+            key_data = read_exactly(file_stream, key_data_length)
+            counts = read_binary_array(file_stream, length)
+
+            if kind == b'S':
+                keys = []
+                position = 0
+                for key_length in key_array:
+                    keys.append(
+                        key_data[position:position + key_length].decode(
+                            'utf-8'
+                        )
+                    )
+                    position += key_length
+            else:
+                keys = key_array.tolist()
+            tables[name] = dict(zip(keys, counts.tolist()))
+
+    for section, keys in BINARY_TABLES.items():
+        for key in keys:
+            if f'{section}.{key}' in tables:
+                statistics[section][key] = tables[f'{section}.{key}']
+
+    results = {}
+    results['error'] = statistics['error']
+    results['options'] = statistics['options']
+    results['basic_statistics'] = statistics['basic_statistics']
+    results['word_analysis'] = (
+        statistics['word_analysis'], tables['top_words'], set()
+    )
+    results['sentence_analysis'] = statistics['sentence_analysis']
+    results['character_analysis'] = (
+        statistics['character_analysis'], tables['sorted_letters']
+    )
+    results['lix'] = statistics['lix']
+    if 'ngram_analysis' in statistics:
+        results['ngram_analysis'] = (
+            statistics['ngram_analysis'], tables['top_ngrams']
+        )
+    if 'encoding' in statistics:
+        results['encoding'] = statistics['encoding']
+    if 'readability_profile' in statistics:
+        results['readability_profile'] = statistics['readability_profile']
+    return results
+
+
+# Files of a corpus: every text file (.txt or compressed .txt.gz, .txt.bz2,
+# .txt.xz) in a directory, or the files matching a glob pattern like
+# books/*.txt
+def find_corpus_files(pattern):
+    paths = []
+    if os.path.isdir(pattern):
+        for extension in TEXT_EXTENSIONS:
+            paths.extend(
+                glob.glob(os.path.join(glob.escape(pattern), '*' + extension))
+            )
+    else:
+        paths = glob.glob(pattern)
+    files = []
+    for path in sorted(paths):
+        if os.path.isfile(path):
+            files.append(path)
+    return files
+
+
+# JSON line of one file of a corpus: the file, its error and its report
+def get_corpus_line(file, results, comprehensive=False):
+    record = {}
+    record['file'] = file
+    record['error'] = results['error']
+    if results['error'] is None:
+        record['report'] = get_json_report(results, comprehensive)
+    return (
+        json.dumps(record, ensure_ascii=False, default=json_default) + '\n'
+    )
+
+
+# Analyse one file of a corpus in a worker process. Every error is returned
+# instead of raised, so one file that can't be read or decoded doesn't stop
+# the rest of the corpus. The JSON line of the file is made in the worker,
+# so only the line and the counts are sent back instead of the results.
+# Returns the line, the error and the counts the corpus summary needs (None
+# if the file failed)
+def analyse_corpus_file(file, options=None, comprehensive=False):
+    try:
+        # Keep messages out of the report lines when they go to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            analysis = analyse_file_range(file, 0, None, options)
+            results = finish_analysis(analysis)
+    except Exception as e:
+        results = {'error': str(e)}
+    line = get_corpus_line(file, results, comprehensive)
+    if results['error'] is not None:
+        return line, results['error'], None
+
+    counts = {}
+    for key in (
+        'total_words', 'sentence_count', 'words_above_6_chars',
+        'heavy_hitters', 'ngrams'
+    ):
+        counts[key] = analysis[key]
+    counts['word_counts'] = None
+    if analysis['vocabulary'] is not None:
+        counts['word_counts'] = get_word_counts(analysis)
+    return line, None, counts
+
+
+# Counters of the whole corpus, filled with the counts of each file
+def new_corpus_summary(options=None):
+    options = options or {}
+    summary = {}
+    summary['options'] = dict(options)
+    summary['files'] = 0
+    summary['failed_files'] = []
+    summary['total_words'] = 0
+    summary['sentence_count'] = 0
+    summary['words_above_6_chars'] = 0
+    summary['word_counts'] = Counter()
+    summary['heavy_hitters'] = None
+    if get_top_words_capacity(options) is not None:
+        summary['heavy_hitters'] = new_heavy_hitters(
+            get_top_words_capacity(options)
+        )
+    # N-grams of different files are not joined
+    summary['ngrams'] = None
+    if options.get('ngram_size') is not None:
+        summary['ngrams'] = new_ngram_analysis(options)
+    return summary
+
+
+def add_to_corpus_summary(summary, file, counts):
+    if counts is None:
+        summary['failed_files'].append(file)
+        return
+    summary['files'] += 1
+    for key in ('total_words', 'sentence_count', 'words_above_6_chars'):
+        summary[key] += counts[key]
+    if summary['heavy_hitters'] is None:
+        summary['word_counts'].update(counts['word_counts'])
+    else:
+        merge_heavy_hitters(summary['heavy_hitters'], counts['heavy_hitters'])
+    if summary['ngrams'] is not None:
+        merge_heavy_hitters(
+            summary['ngrams']['heavy_hitters'],
+            counts['ngrams']['heavy_hitters']
+        )
+
+
+# Total words, most common words and LIX of all files together
+def finish_corpus_summary(summary):
+    top_words = summary['options'].get('top_words', 10)
+    results = {}
+    results['files'] = summary['files']
+    results['failed_files'] = summary['failed_files']
+    results['total_words'] = summary['total_words']
+    heavy_hitters = summary['heavy_hitters']
+    if heavy_hitters is None:
+        results['top_words'] = top_k(
+            capitalize_words(summary['word_counts']), top_words
+        )
+    else:
+        prune_heavy_hitters(heavy_hitters)
+        results['top_words'] = top_k(
+            capitalize_words(heavy_hitters['counts']), top_words
+        )
+        results['top_words_max_error'] = heavy_hitters['error']
+    if summary['ngrams'] is not None:
+        ngram_statistics, results['top_ngrams'] = finish_ngram_analysis(
+            summary
+        )
+        results['top_ngrams_max_error'] = (
+            ngram_statistics['top_ngrams_max_error']
+        )
+    results['lix'] = lix_score(
+        summary['total_words'], summary['sentence_count'],
+        summary['words_above_6_chars']
+    )
+    return results
+
+
+# Corpus mode: analyse every file of a directory or glob pattern in a pool of
+# worker processes. A JSON line with the report of each file is written to
+# file_stream as soon as the file is finished, and a last line with the
+# summary of the whole corpus. Progress is printed to stderr.
+# Returns the summary
+def analyse_corpus(
+    pattern, file_stream, workers=1, options=None, comprehensive=False
+):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    files = find_corpus_files(pattern)
+    summary = new_corpus_summary(options)
+    if len(files) == 0:
+        print(f'No files found matching {pattern}', file=sys.stderr)
+
+    # Files are added to the summary in order, whichever finishes first, so
+    # words with the same count are always listed in the same order
+    finished_counts = {}
+    next_file = 0
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = {}
+        for i in range(0, len(files), 1):
+            future = executor.submit(
+                analyse_corpus_file, files[i], options, comprehensive
+            )
+            futures[future] = i
+
+        finished = 0
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                line, error, counts = future.result()
+            except Exception as e:
+                # The worker process itself failed
+                error, counts = str(e), None
+                line = get_corpus_line(files[i], {'error': error})
+
+            file_stream.write(line)
+            file_stream.flush()
+
+            finished += 1
+            if error is None:
+                print(f'[{finished}/{len(files)}] {files[i]}', file=sys.stderr)
+            else:
+                print(
+                    f'[{finished}/{len(files)}] {files[i]} failed: {error}',
+                    file=sys.stderr
+                )
+
+            finished_counts[i] = counts
+            while next_file in finished_counts:
+                add_to_corpus_summary(
+                    summary, files[next_file],
+                    finished_counts.pop(next_file)
+                )
+                next_file += 1
+
+    results = finish_corpus_summary(summary)
+    file_stream.write(
+        json.dumps({'corpus_summary': results}, ensure_ascii=False) + '\n'
+    )
+    return results
+
+
+# Analyse a corpus from the menu and export the reports to
+# corpus_export.jsonl in the current directory
+def export_corpus(pattern, state=None):
+    if state is None:
+        state = {}
+    file_name = 'corpus_export.jsonl'
+
+    if os.path.exists(os.getcwd() + '/' + file_name):
+        print(
+            f'Prevented overwriting. {file_name} already exists, please '
+            'rename or remove it.'
+        )
+        return
+
+    print('Analysing corpus...')
+    try:
+        with open(file_name, 'w', encoding='utf-8') as file_stream:
+            summary = analyse_corpus(
+                pattern, file_stream, state.get('workers', 1),
+                state.get('options', {})
+            )
+    except Exception as e:
+        print(f'Error exporting corpus: {e}')
+        return
+
+    print(f'\nFiles analysed: {summary["files"]}')
+    if len(summary['failed_files']) != 0:
+        print(f'Files that could not be read: {len(summary["failed_files"])}')
+    print(f'Total words: {summary["total_words"]}')
+    print(f'LIX: {summary["lix"]}')
+    print('Top words:')
+    for word, count in summary['top_words'].items():
+        print(f'{word} appears {count} times')
+    print(f'\nExport successful, {file_name} created in current directory.')
+
+
+# Chart images are drawn with the Agg backend, which needs no display, in
+# worker processes. Each chart of a file is first turned into plain data
+# (see get_charts) with histograms already binned, so only small lists are
+# sent to the workers however long the file is
+CHART_FORMATS = ('png', 'svg')
 
-            except Exception as e:
-                print(f'Error exporting JSON: {e}')
-                return
-    else:
-        # Normal report, text file
-        if not json_export:
-            try:
-                with open(file_name, 'w', encoding='utf-8') as file_stream:
-                    file_stream.write('===== Basic Statistics =====\n')
-                    for key in basic_statistics.keys():
-                        file_stream.write(f'{key} : {basic_statistics[key]}\n')
-                    file_stream.write(f'LIX: {str(lix)}')
-
-                    file_stream.write('\n===== Word Analysis =====\n')
-                    for key in word_analysis_stats.keys():
-                        # Don't include these in simple report
-                        if key not in (
-                            'word_lengths_unique', 'word_lengths_duplicates'
-                        ):
-                            file_stream.write(
-                                f'{key} : {word_analysis_stats[key]}\n'
-                            )
-                    file_stream.write('----- Top 10 words -----\n')
-                    for key in top_words.keys():
-                        file_stream.write(
-                            f'{key} appears {top_words[key]} times\n'
-                        )
 
-                    file_stream.write('\n\n===== Sentence Analysis =====\n')
-                    for key in sentence_analysis_statistics.keys():
-                        # Don't include these in simple report
-                        if key not in (
-                            'sentence_lengths', 'only_lengths',
-                            'longest_sentence', 'shortest_sentence'
-                        ):
-                            file_stream.write(
-                                f'{key} : {sentence_analysis_statistics[key]}\n'
-                            )
-
-                    file_stream.write('\n===== Character Analysis =====\n')
-                    for key in char_analysis_stats.keys():
-                        file_stream.write(
-                            f'{key} : {char_analysis_stats[key]}\n'
-                        )
-                    file_stream.write('----- Top 12 Letters -----\n')
-                    for letter in sorted_letters.keys():
-                        file_stream.write(
-                            f'{letter} appears {sorted_letters[letter]} times\n'
-                        )
-            except Exception as e:
-                print(f'Error exporting text file: {e}')
-                return
-        # Normal report, JSON
-        else:
-            try:
-                json_export_dict = {}
-                word_analysis_statistics_filtered = {}
-                sentence_analysis_statistics_filtered = {}
-
-                for key in word_analysis_stats:
-                    if key not in (
-                        'word_lengths_unique', 'word_lengths_duplicates'
-                    ):
-                        word_analysis_statistics_filtered[key] = (
-                            word_analysis_stats[key]
-                        )
-                for key in sentence_analysis_statistics:
-                    if key not in (
-                        'sentence_lengths', 'only_lengths',
-                        'longest_sentence', 'shortest_sentence'
-                    ):
-                        sentence_analysis_statistics_filtered[key] = (
-                            sentence_analysis_statistics[key]
-                        )
+# Switch matplotlib to a backend that only draws to files
+def use_headless_backend():
+    import matplotlib
+    matplotlib.use('Agg')
 
-                json_export_dict['basic_statistics'] = basic_statistics
-                json_export_dict['LIX_score'] = lix
-                json_export_dict['word_analysis'] = (
-                    word_analysis_statistics_filtered
-                )
-                json_export_dict['top_10_words'] = top_words
-                json_export_dict['sentence_stats'] = (
-                    sentence_analysis_statistics_filtered
-                )
-                json_export_dict['char_stats'] = char_analysis_stats
-                json_export_dict['sorted_letters'] = sorted_letters
-
-                with open(file_name, 'w', encoding='utf-8') as json_fs:
-                    json.dump(
-                        json_export_dict,
-                        json_fs,
-                        indent=4,
-                        ensure_ascii=False
-                    )
 
-            except Exception as e:
-                print(f'Error exporting JSON: {e}')
-                return
+# Counts of values in bins of equal width like plt.hist, as (counts, edges).
+# data is either a list of values or a dictionary of {value: amount}
+def bin_histogram(data, bins):
+    if not isinstance(data, dict):
+        data = count_lengths(data)
+    low = 0
+    high = 1
+    if len(data) != 0:
+        low = min(data)
+        high = max(data)
+    if low == high:
+        low -= 0.5
+        high += 0.5
+    width = (high - low) / bins
+    edges = []
+    for i in range(0, bins + 1, 1):
+        edges.append(low + i * width)
+    counts = [0] * bins
+    for value, amount in data.items():
+        counts[min(int((value - low) / width), bins - 1)] += amount
+    return counts, edges
 
-    print(f'Export successful, {file_name} created in current directory.')
-    return
+
+# Show the chart, or save it as an image when output is a file name (the
+# format is taken from its extension)
+def finish_chart(plt, output=None):
+    if output is None:
+        plt.show()
+    else:
+        plt.savefig(output)
+        plt.close()
 
 
 # Creates and displays pie chart
-def create_pie_chart(labels, sizes, title=''):
+def create_pie_chart(labels, sizes, title='', output=None):
+    import matplotlib.pyplot as plt
+
     plt.subplots(figsize=(10, 6))
 
     colors = ['#4D6DA1', '#55A868', '#C44E52', '#8172B2', '#CCB974']
@@ -584,14 +3374,16 @@ def create_pie_chart(labels, sizes, title=''):
 
     plt.title(title, fontsize=16, fontweight='bold', pad=15)
     plt.axis('equal')
-    plt.show()
+    finish_chart(plt, output)
 
 
 # Creates and displays bar graph
 def create_bar_graph(
     labels, sizes, title='', x_label='', y_label='',
-    textbox_text='', textbox_left=False, text_rotation=True
+    textbox_text='', textbox_left=False, text_rotation=True, output=None
 ):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(10, 6))
 
     colors = ['#4D6DA1', '#55A868', '#C44E52', '#8172B2', '#CCB974']
@@ -628,19 +3420,55 @@ def create_bar_graph(
     plt.xlabel(x_label, fontsize=12)
     plt.ylabel(y_label, fontsize=12)
     plt.tight_layout()
-    plt.show()
+    finish_chart(plt, output)
 
 
-# Creates and displays bar graph
+# Creates and displays line chart with a line for each of the series
+# {label: values}, all drawn over the same x values
+def create_line_chart(
+    x, series, title='', x_label='', y_label='', output=None
+):
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+
+    colors = ['#CE882C', '#4D6DA1', '#55A868', '#C44E52', '#8172B2']
+    i = 0
+    for label, values in series.items():
+        ax.plot(
+            x, values, label=label, color=colors[i % len(colors)],
+            linewidth=1.5, marker='o', markersize=3
+        )
+        i += 1
+
+    ax.legend(loc='upper right')
+    ax.grid(True, linestyle='--', alpha=0.6)
+    plt.title(title, fontsize=16, fontweight='bold', pad=15)
+    plt.xlabel(x_label, fontsize=12)
+    plt.ylabel(y_label, fontsize=12)
+    plt.tight_layout()
+    finish_chart(plt, output)
+
+
+# Creates and displays histogram
+# data is either a list of values, a dictionary of {value: amount} or
+# (counts, edges) already binned by bin_histogram
 def create_histogram(
     data, bins, title='', x_label='', y_label='',
-    textbox_text='', textbox_left=False
+    textbox_text='', textbox_left=False, output=None
 ):
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(10, 6))
 
     color = '#CE882C'
+    if not isinstance(data, tuple):
+        data = bin_histogram(data, bins)
+    counts, edges = data
+    # The left edge of each bin, weighted with its count
     n, bins_edges, patches = plt.hist(
-        data, bins=bins, color=color, edgecolor='black', linewidth=0.8
+        edges[:-1], bins=edges, weights=counts, color=color,
+        edgecolor='black', linewidth=0.8
     )
 
     for i in range(0, len(patches), 1):
@@ -669,7 +3497,656 @@ def create_histogram(
     plt.xlabel(x_label, fontsize=12)
     plt.ylabel(y_label, fontsize=12)
     plt.tight_layout()
-    plt.show()
+    finish_chart(plt, output)
+
+
+# Charts of the results, as (name, kind, arguments) where kind is the key of
+# the function in CHART_FUNCTIONS that draws it with these arguments and name
+# is used in the file names of chart images. Histograms are binned here, so
+# the charts are small enough to send to worker processes
+def get_basic_statistics_charts(results, file):
+    statistics = results['basic_statistics']
+    lix = results['lix']
+
+    # Bar graph of basic statistics and LIX
+    arguments = {}
+    arguments['labels'] = [
+        'Lines', 'Words', 'Characters (w/ spaces)', 'Characters (no spaces)'
+    ]
+    arguments['sizes'] = [
+        statistics['total_lines'],
+        statistics['total_words'],
+        statistics['total_characters'],
+        statistics['total_characters_no_spaces']
+    ]
+    arguments['title'] = 'Basic Statistics\n' + file
+    arguments['textbox_text'] = (
+        f"Average words per line: {statistics['avg_words_per_line']}\n"
+        f"Average characters per word: "
+        f"{statistics['avg_characters_per_word']}\n"
+        f"LIX score: {lix}"
+    )
+    arguments['textbox_left'] = True
+    return [('basic_statistics', 'bar', arguments)]
+
+
+def get_word_charts(results, file):
+    statistics, top_10_words, unique_words = results['word_analysis']
+
+    if 'unique_words_estimate' in statistics:
+        textbox_text = (
+            f"About {statistics['unique_words_estimate']} unique words "
+            f"(estimate, standard error "
+            f"{statistics['unique_words_standard_error']})"
+        )
+        if 'top_words_max_error' in statistics:
+            textbox_text += (
+                f"\nApproximate counts, at most "
+                f"{statistics['top_words_max_error']} too low"
+            )
+    elif 'top_words_max_error' in statistics:
+        textbox_text = (
+            f"Approximate counts, at most "
+            f"{statistics['top_words_max_error']} too low"
+        )
+    else:
+        textbox_text = (
+            f"{statistics['unique_words_count']} unique words\n"
+            f"{statistics['words_only_once_count']} words only appear once"
+        )
+    top_words = {}
+    top_words['labels'] = list(top_10_words.keys())
+    top_words['sizes'] = list(top_10_words.values())
+    top_words['title'] = (
+        f"Top {results['options'].get('top_words', 10)} Words\n{file}"
+    )
+    top_words['textbox_text'] = textbox_text
+
+    # Histogram counts when analysed in streaming mode, all words when
+    # unique words weren't counted
+    if 'unique_word_length_counts' in statistics:
+        word_lengths = statistics['unique_word_length_counts']
+    elif 'word_lengths_unique' in statistics:
+        word_lengths = statistics['word_lengths_unique']
+    elif 'word_length_counts' in statistics:
+        word_lengths = statistics['word_length_counts']
+    else:
+        word_lengths = statistics['word_lengths_duplicates']
+    lengths = {}
+    lengths['data'] = bin_histogram(word_lengths, 10)
+    lengths['bins'] = 10
+    lengths['title'] = 'Word length distribution\n' + file
+    return [
+        ('top_words', 'bar', top_words),
+        ('word_lengths', 'histogram', lengths)
+    ]
+
+
+def get_sentence_charts(results, file):
+    statistics = results['sentence_analysis']
+
+    # Histogram counts when analysed in streaming mode
+    if 'sentence_length_counts' in statistics:
+        sentence_lengths = statistics['sentence_length_counts']
+    else:
+        sentence_lengths = statistics['only_lengths']
+    lengths = {}
+    lengths['data'] = bin_histogram(sentence_lengths, 10)
+    lengths['bins'] = 10
+    lengths['title'] = 'Sentence length distribution\n' + file
+    lengths['textbox_text'] = (
+        f"Average words per sentence: "
+        f"{round(statistics['avg_words_per_sentence'], 3)}\n"
+        f"Longest sentence: {len(statistics['longest_sentence'])} "
+        f"(Printed in terminal)\n"
+        f"Shortest sentence: {len(statistics['shortest_sentence'])} "
+        f"(Printed in terminal)"
+    )
+
+    keys_as_strings = []
+    for i in statistics['top_10_sentence_lengths'].keys():
+        keys_as_strings.append(str(i))
+    top_lengths = {}
+    top_lengths['labels'] = keys_as_strings
+    top_lengths['sizes'] = list(
+        statistics['top_10_sentence_lengths'].values()
+    )
+    top_lengths['title'] = 'Top 10 Lengths of Sentences\n' + file
+    top_lengths['x_label'] = 'Sentence Length'
+    top_lengths['y_label'] = 'Amount'
+    top_lengths['text_rotation'] = False
+    return [
+        ('sentence_lengths', 'histogram', lengths),
+        ('top_sentence_lengths', 'bar', top_lengths)
+    ]
+
+
+def get_character_charts(results, file):
+    statistics, sorted_letters = results['character_analysis']
+
+    letters = {}
+    letters['labels'] = list(sorted_letters.keys())
+    letters['sizes'] = list(sorted_letters.values())
+    letters['title'] = (
+        f"Top {results['options'].get('top_letters', 12)} Letters\n{file}"
+    )
+    letters['x_label'] = 'Letters'
+    letters['y_label'] = 'Amount'
+    letters['textbox_text'] = (
+        f"Total letters: {statistics['total_letters']}\n"
+        f"Uppercase: {statistics['total_upper']}\n"
+        f"Lowercase: {statistics['total_lower']}"
+    )
+    letters['text_rotation'] = False
+
+    character_types = {}
+    character_types['labels'] = [
+        'Letters', 'Punctuation', 'Digits', 'Spaces', 'Other'
+    ]
+    character_types['sizes'] = [
+        statistics['total_letters'],
+        statistics['total_punctuations'],
+        statistics['total_digits'],
+        statistics['total_spaces'],
+        statistics['other_chars']
+    ]
+    character_types['title'] = f"Character Type Distribution\n{file}"
+    return [
+        ('top_letters', 'bar', letters),
+        ('character_types', 'pie', character_types)
+    ]
+
+
+# No charts when the results have no n-gram analysis
+def get_ngram_charts(results, file):
+    if 'ngram_analysis' not in results:
+        return []
+    statistics, top_ngrams = results['ngram_analysis']
+    textbox_text = f"{statistics['total_ngrams']} n-grams counted"
+    if statistics['top_ngrams_max_error'] != 0:
+        textbox_text += (
+            f"\nApproximate counts, at most "
+            f"{statistics['top_ngrams_max_error']} too low"
+        )
+    arguments = {}
+    arguments['labels'] = list(top_ngrams.keys())
+    arguments['sizes'] = list(top_ngrams.values())
+    arguments['title'] = (
+        f"Top {len(top_ngrams)} {statistics['ngram_size']}-grams\n{file}"
+    )
+    arguments['textbox_text'] = textbox_text
+    return [('top_ngrams', 'bar', arguments)]
+
+
+# No charts when the results have no readability profile
+def get_readability_charts(results, file):
+    if 'readability_profile' not in results:
+        return []
+    profile = results['readability_profile']
+    arguments = {}
+    arguments['x'] = profile['start_word']
+    arguments['series'] = {
+        'LIX': profile['lix'],
+        'Average sentence length': profile['avg_sentence_length'],
+        'Long words (%)': profile['long_words_percent']
+    }
+    if profile['unit'] == 'chapters':
+        arguments['title'] = f'Readability per chapter\n{file}'
+    else:
+        arguments['title'] = (
+            f"Readability per {profile['window']} {profile['unit']}\n{file}"
+        )
+    arguments['x_label'] = 'Word'
+    return [('readability_profile', 'line', arguments)]
+
+
+# Every chart of the results
+def get_charts(results, file):
+    charts = []
+    charts.extend(get_basic_statistics_charts(results, file))
+    charts.extend(get_word_charts(results, file))
+    charts.extend(get_sentence_charts(results, file))
+    charts.extend(get_character_charts(results, file))
+    charts.extend(get_ngram_charts(results, file))
+    charts.extend(get_readability_charts(results, file))
+    return charts
+
+
+CHART_FUNCTIONS = {
+    'bar': create_bar_graph,
+    'histogram': create_histogram,
+    'line': create_line_chart,
+    'pie': create_pie_chart
+}
+
+
+# Show a chart, or save it as an image when output is a file name
+def draw_chart(chart, output=None):
+    name, kind, arguments = chart
+    CHART_FUNCTIONS[kind](**arguments, output=output)
+
+
+# Draw charts one after another
+def draw_charts(charts):
+    for chart in charts:
+        draw_chart(chart)
+
+
+# Charts of a file, analysed or taken from the cache in a worker process.
+# Errors are returned instead of raised like in analyse_corpus_file.
+# Returns the charts and None, or None and the error
+def get_file_charts(file, workers=1, options=None):
+    try:
+        # Keep messages out of the report when it goes to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            results = get_analysis(file, workers=workers, options=options)
+    except Exception as e:
+        return None, str(e)
+    if results['error'] is not None:
+        return None, results['error']
+    try:
+        return get_charts(results, file), None
+    except Exception as e:
+        # Exported results without the data of a chart
+        return None, str(e)
+
+
+# Path of the image of a chart of a file: the file name without extension
+# and the chart name, like iliad_word_lengths.png
+def get_chart_path(directory, file, name, chart_format):
+    compression = get_compression(file)
+    if compression is not None:
+        file = file[:-len(compression)]
+    stem = os.path.splitext(os.path.basename(file))[0]
+    return os.path.join(directory, f'{stem}_{name}.{chart_format}')
+
+
+# Save every chart of the files as images in directory, in a pool of worker
+# processes that draw with the headless backend. With several files each
+# file is also analysed in a worker, a single file is analysed with all
+# workers first. Progress is printed to stderr.
+# Returns the images written and the files that failed
+def render_charts(
+    files, directory, chart_format='png', workers=1, options=None
+):
+    from concurrent.futures import (
+        Future, ProcessPoolExecutor, as_completed
+    )
+
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(
+            f'Unknown chart format {chart_format}, use one of '
+            f'{", ".join(CHART_FORMATS)}'
+        )
+    # Fails early when matplotlib is not installed
+    use_headless_backend()
+    os.makedirs(directory, exist_ok=True)
+    images = []
+    failed_files = []
+
+    with ProcessPoolExecutor(
+        max_workers=max(workers, 1), initializer=use_headless_backend
+    ) as executor:
+        analyses = {}
+        if len(files) == 1:
+            # A single file is analysed in this process with all workers
+            future = Future()
+            future.set_result(get_file_charts(files[0], workers, options))
+            analyses[future] = files[0]
+        else:
+            for file in files:
+                future = executor.submit(get_file_charts, file, 1, options)
+                analyses[future] = file
+
+        drawings = {}
+        for future in as_completed(analyses):
+            file = analyses[future]
+            try:
+                charts, error = future.result()
+            except Exception as e:
+                # The worker process itself failed
+                charts, error = None, str(e)
+            if error is not None:
+                print(f'{file} failed: {error}', file=sys.stderr)
+                failed_files.append(file)
+                continue
+            for chart in charts:
+                output = get_chart_path(
+                    directory, file, chart[0], chart_format
+                )
+                drawings[executor.submit(draw_chart, chart, output)] = output
+
+        for future in as_completed(drawings):
+            output = drawings[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f'{output} failed: {e}', file=sys.stderr)
+                continue
+            images.append(output)
+            print(
+                f'[{len(images)}/{len(drawings)}] {output}', file=sys.stderr
+            )
+    images.sort()
+    return images, failed_files
+
+
+# Analysis service: a long-running process that analyses files and raw text
+# for clients on a Unix socket or a localhost HTTP port, on a pool of worker
+# processes that are started once instead of once per analysis.
+# Every request is a JSON object on its own line:
+#   {"id": 1, "path": "book.txt"} or {"id": 2, "text": "Some text."}
+# with optional "options" (analysis options, see analyse_file, added to the
+# options the service was started with) and "comprehensive". A JSON line
+#   {"id": 1, "error": null, "report": {...}}
+# is sent back as soon as each request is finished, so the answers to
+# requests sent on one connection can come in a different order. Over HTTP
+# the request lines are the body of a POST and the answers are streamed back
+# as the body of the response.
+# At most max_pending requests are analysed or waiting for a worker at a
+# time. When that many are pending the service stops reading from clients,
+# so a client that sends faster than the workers analyse is slowed down by
+# the socket instead of filling the memory of the service
+SERVICE_MAX_PENDING_PER_WORKER = 4
+# Longest request line, raw text requests can be whole documents
+SERVICE_MAX_REQUEST_SIZE = 64 * 1024 * 1024
+# Reports of files, as encoded JSON, are kept in memory for all clients up
+# to this many bytes, the disk cache keeps the results of the rest
+SERVICE_CACHE_BYTES = 256 * 1024 * 1024
+# Options a request may set
+SERVICE_OPTIONS = (
+    'streaming', 'top_words', 'top_letters', 'approximate_top_words',
+    'hyperloglog_precision', 'ngram_size', 'top_ngrams', 'ngram_capacity',
+    'ngram_stopwords', 'readability_unit', 'readability_window',
+    'chapter_pattern', 'encoding', 'encoding_errors'
+)
+
+
+# Analyse raw text like the text of a file
+def analyse_text(text, options=None):
+    analysis = new_analysis(options)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    count_characters(analysis, text)
+    update_analysis(analysis, text)
+    return finish_analysis(analysis)
+
+
+# Analyse a request in a worker process: a file (from the disk cache when
+# the file hasn't changed) or raw text. The report is made and encoded as
+# JSON in the worker, so only its bytes are sent back instead of the results.
+# Returns the error and the report (None if there was an error)
+def analyse_service_request(file, text, options, comprehensive=False):
+    # Keep messages out of the output of the service
+    with contextlib.redirect_stdout(sys.stderr):
+        if file is not None:
+            results = get_analysis(file, workers=1, options=options)
+        else:
+            results = analyse_text(text, options)
+    if results['error'] is not None:
+        return results['error'], None
+    report = json.dumps(
+        get_json_report(results, comprehensive), ensure_ascii=False,
+        default=json_default
+    )
+    return None, report.encode()
+
+
+# Start the worker processes of a service and return its state
+def new_service(workers=1, max_pending=None, options=None):
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor
+
+    if max_pending is None:
+        max_pending = workers * SERVICE_MAX_PENDING_PER_WORKER
+    service = {}
+    service['options'] = dict(options or {})
+    service['executor'] = ProcessPoolExecutor(max_workers=workers)
+    # Workers are only started when there is work for them, so start them
+    # all now with a task that does nothing instead of with the first
+    # requests
+    list(service['executor'].map(time.sleep, [0] * workers))
+    service['pending'] = asyncio.Semaphore(max_pending)
+    # Reports of files by file, options and comprehensive, with the
+    # fingerprint of the file. The least recently used are removed first
+    service['report_cache'] = {}
+    service['report_cache_bytes'] = 0
+    return service
+
+
+# Options of a request added to the options of the service
+def get_request_options(service, request):
+    options = dict(service['options'])
+    request_options = request.get('options') or {}
+    if not isinstance(request_options, dict):
+        raise ValueError('options must be an object')
+    for key, value in request_options.items():
+        if key not in SERVICE_OPTIONS:
+            raise ValueError(f'Unknown option {key}')
+        # Lists from JSON are compared as tuples in the cache keys
+        if isinstance(value, list):
+            value = tuple(sorted(value))
+        options[key] = value
+    return options
+
+
+# Report of a file: from the memory cache if the file hasn't changed since,
+# otherwise from a worker. Returns the error and the report like
+# analyse_service_request
+async def get_service_file_report(service, file, options, comprehensive):
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    memory_cache = service['report_cache']
+    fingerprint = None
+    if not file.endswith(BINARY_EXTENSION):
+        try:
+            fingerprint = file_fingerprint(file)
+        except OSError:
+            # Let the analysis report the error
+            pass
+    if fingerprint is not None:
+        memory_key = (fingerprint[0], get_options_key(options), comprehensive)
+        cached = memory_cache.pop(memory_key, None)
+        if cached is not None:
+            if cached[0] == fingerprint:
+                memory_cache[memory_key] = cached
+                return None, cached[1]
+            service['report_cache_bytes'] -= len(cached[1])
+
+    error, report = await loop.run_in_executor(
+        service['executor'], analyse_service_request, file, None, options,
+        comprehensive
+    )
+    if fingerprint is not None and error is None:
+        # Another request for the same report may have finished first
+        cached = memory_cache.pop(memory_key, None)
+        if cached is not None:
+            service['report_cache_bytes'] -= len(cached[1])
+        memory_cache[memory_key] = (fingerprint, report)
+        service['report_cache_bytes'] += len(report)
+        while service['report_cache_bytes'] > SERVICE_CACHE_BYTES:
+            cached = memory_cache.pop(next(iter(memory_cache)))
+            service['report_cache_bytes'] -= len(cached[1])
+    return error, report
+
+
+# Answer one request line. Returns the answer as an encoded JSON line, the
+# report is put in it as it came from the worker
+async def answer_service_request(service, line):
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    answer = {'id': None}
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError('A request must be a JSON object')
+        answer['id'] = request.get('id')
+        options = get_request_options(service, request)
+        comprehensive = bool(request.get('comprehensive'))
+        if isinstance(request.get('path'), str):
+            error, report = await get_service_file_report(
+                service, request['path'], options, comprehensive
+            )
+        elif isinstance(request.get('text'), str):
+            error, report = await loop.run_in_executor(
+                service['executor'], analyse_service_request, None,
+                request['text'], options, comprehensive
+            )
+        else:
+            raise ValueError('A request needs a path or text')
+    except Exception as e:
+        error, report = str(e), None
+    answer['error'] = error
+    line = json.dumps(answer, ensure_ascii=False).encode()
+    if report is None:
+        return line + b'\n'
+    return line[:-1] + b', "report": ' + report + b'}\n'
+
+
+# Answer a request line and write the answer when it is ready. One of the
+# max_pending places is taken for the request before it was started
+async def write_service_answer(service, line, writer, write_lock):
+    try:
+        answer = await answer_service_request(service, line)
+    finally:
+        service['pending'].release()
+    async with write_lock:
+        try:
+            writer.write(answer)
+            await writer.drain()
+        except ConnectionError:
+            # The client disconnected, the other answers are dropped too
+            pass
+
+
+# Answer request lines as they are read, every answer is written as soon as
+# it is ready. A new request is only started when fewer than max_pending
+# requests of all clients are pending
+async def answer_service_requests(service, lines, writer):
+    import asyncio
+
+    write_lock = asyncio.Lock()
+    # Requests that are still pending
+    tasks = set()
+    try:
+        async for line in lines:
+            if line.strip() == b'':
+                continue
+            await service['pending'].acquire()
+            task = asyncio.create_task(
+                write_service_answer(service, line, writer, write_lock)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        await asyncio.gather(*tasks)
+
+
+# Lines sent by a client until it closes its side of the connection
+async def read_request_lines(reader):
+    while True:
+        line = await reader.readline()
+        if line == b'':
+            return
+        yield line
+
+
+async def handle_service_client(service, reader, writer):
+    try:
+        await answer_service_requests(
+            service, read_request_lines(reader), writer
+        )
+    except (ValueError, ConnectionError) as e:
+        # Request line too long or the client disconnected
+        print(f'Client failed: {e}', file=sys.stderr)
+    finally:
+        writer.close()
+
+
+# HTTP client: POST with request lines as the body, the answers are the body
+# of the response
+async def handle_service_http_client(service, reader, writer):
+    import asyncio
+
+    try:
+        method = (await reader.readline()).split(b' ')[0]
+        length = None
+        while True:
+            header = await reader.readline()
+            if header.strip() == b'':
+                break
+            name, _, value = header.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        if method != b'POST':
+            writer.write(
+                b'HTTP/1.1 405 Method Not Allowed\r\nAllow: POST\r\n'
+                b'Content-Length: 0\r\nConnection: close\r\n\r\n'
+            )
+        elif length is None or length > SERVICE_MAX_REQUEST_SIZE:
+            writer.write(
+                b'HTTP/1.1 411 Length Required\r\n'
+                b'Content-Length: 0\r\nConnection: close\r\n\r\n'
+            )
+        else:
+            body = await reader.readexactly(length)
+            writer.write(
+                b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: application/x-ndjson\r\n'
+                b'Connection: close\r\n\r\n'
+            )
+            await answer_service_requests(
+                service, iter_body_lines(body), writer
+            )
+        await writer.drain()
+    except (ValueError, ConnectionError, asyncio.IncompleteReadError) as e:
+        print(f'Client failed: {e}', file=sys.stderr)
+    finally:
+        writer.close()
+
+
+async def iter_body_lines(body):
+    for line in body.split(b'\n'):
+        yield line
+
+
+# Run the analysis service until it is interrupted. Listens on the Unix
+# socket at socket_path, or on port of localhost over HTTP
+async def run_service(
+    socket_path=None, port=None, workers=1, max_pending=None, options=None
+):
+    import asyncio
+
+    service = new_service(workers, max_pending, options)
+    try:
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(
+                lambda reader, writer: handle_service_client(
+                    service, reader, writer
+                ),
+                socket_path, limit=SERVICE_MAX_REQUEST_SIZE
+            )
+            address = socket_path
+        else:
+            server = await asyncio.start_server(
+                lambda reader, writer: handle_service_http_client(
+                    service, reader, writer
+                ),
+                '127.0.0.1', port
+            )
+            address = f'http://127.0.0.1:{port}'
+        print(
+            f'Analysis service listening on {address} with {workers} '
+            'workers',
+            file=sys.stderr
+        )
+        async with server:
+            await server.serve_forever()
+    finally:
+        service['executor'].shutdown(cancel_futures=True)
+        if socket_path is not None and os.path.exists(socket_path):
+            os.remove(socket_path)
 
 
 # Handle user choices from the menu
@@ -689,65 +4166,26 @@ def handle_choices(choice, state):
             # and show a bar graph
             if state.get('current_file'):
                 clear_terminal()
-                statistics = get_basic_statistics(state['current_file'])
-                lix = calculate_lix(state['current_file'])
-
-                # Create bar graph of basic statistics and LIX
-                labels = [
-                    'Lines', 'Words', 'Characters (w/ spaces)',
-                    'Characters (no spaces)'
-                ]
-                sizes = [
-                    statistics['total_lines'],
-                    statistics['total_words'],
-                    statistics['total_characters'],
-                    statistics['total_characters_no_spaces']
-                ]
-                create_bar_graph(
-                    labels,
-                    sizes,
-                    'Basic Statistics\n' + state['current_file'],
-                    textbox_text=(
-                        f"Average words per line: "
-                        f"{statistics['avg_words_per_line']}\n"
-                        f"Average characters per word: "
-                        f"{statistics['avg_characters_per_word']}\n"
-                        f"LIX score: {lix}"
-                    ),
-                    textbox_left=True
-                )
+                results = get_analysis(state['current_file'], state)
+                draw_charts(get_basic_statistics_charts(
+                    results, state['current_file']
+                ))
             else:
                 print('Please load a file first.')
         # WORD FREQUENCY ANALYSIS
         case '3':
             if state.get('current_file'):
                 clear_terminal()
-                statistics, top_10_words, unique_words = word_analysis(
-                    state['current_file']
-                )
-
-                create_bar_graph(
-                    top_10_words.keys(),
-                    top_10_words.values(),
-                    'Top 10 Words\n' + state['current_file'],
-                    textbox_text=(
-                        f"{statistics['unique_words_count']} unique words\n"
-                        f"{statistics['words_only_once_count']} "
-                        f"words only appear once"
-                    )
-                )
-                create_histogram(
-                    statistics['word_lengths_unique'],
-                    bins=10,
-                    title='Word length distribution\n' + state['current_file']
-                )
+                results = get_analysis(state['current_file'], state)
+                draw_charts(get_word_charts(results, state['current_file']))
             else:
                 print('Please load a file first.')
         # SENTENCE ANALYSIS
         case '4':
             if state.get('current_file'):
                 clear_terminal()
-                statistics = sentence_analysis(state['current_file'])
+                results = get_analysis(state['current_file'], state)
+                statistics = results['sentence_analysis']
 
                 print(
                     f"Longest sentence: "
@@ -758,79 +4196,19 @@ def handle_choices(choice, state):
                     f"{statistics['shortest_sentence_str']}\n"
                 )
 
-                keys_as_strings = []
-                for i in statistics['top_10_sentence_lengths'].keys():
-                    keys_as_strings.append(str(i))
-
-                create_histogram(
-                    statistics['only_lengths'],
-                    bins=10,
-                    title=(
-                        'Sentence length distribution\n' +
-                        state['current_file']
-                    ),
-                    textbox_text=(
-                        f"Average words per sentence: "
-                        f"{round(statistics['avg_words_per_sentence'], 3)}\n"
-                        f"Longest sentence: "
-                        f"{len(statistics['longest_sentence'])} "
-                        f"(Printed in terminal)\n"
-                        f"Shortest sentence: "
-                        f"{len(statistics['shortest_sentence'])} "
-                        f"(Printed in terminal)"
-                    )
-                )
-                create_bar_graph(
-                    keys_as_strings,
-                    statistics['top_10_sentence_lengths'].values(),
-                    title=(
-                        'Top 10 Lengths of Sentences\n' +
-                        state['current_file']
-                    ),
-                    x_label='Sentence Length',
-                    y_label='Amount',
-                    text_rotation=False
-                )
+                draw_charts(get_sentence_charts(
+                    results, state['current_file']
+                ))
             else:
                 print('Please load a file first.')
         # CHARACTER ANALYSIS
         case '5':
             if state.get('current_file'):
                 clear_terminal()
-                statistics, sorted_letters = character_analysis(
-                    state['current_file']
-                )
-
-                create_bar_graph(
-                    sorted_letters.keys(),
-                    sorted_letters.values(),
-                    title=f"Top 12 Letters\n{state['current_file']}",
-                    x_label='Letters',
-                    y_label='Amount',
-                    textbox_text=(
-                        f"Total letters: {statistics['total_letters']}\n"
-                        f"Uppercase: {statistics['total_upper']}\n"
-                        f"Lowercase: {statistics['total_lower']}"
-                    ),
-                    text_rotation=False
-                )
-
-                labels = [
-                    'Letters', 'Punctuation', 'Digits', 'Spaces', 'Other'
-                ]
-                sizes = [
-                    statistics['total_letters'],
-                    statistics['total_punctuations'],
-                    statistics['total_digits'],
-                    statistics['total_spaces'],
-                    statistics['other_chars']
-                ]
-                create_pie_chart(
-                    labels,
-                    sizes,
-                    title=f"Character Type Distribution\n"
-                    f"{state['current_file']}"
-                )
+                results = get_analysis(state['current_file'], state)
+                draw_charts(get_character_charts(
+                    results, state['current_file']
+                ))
             else:
                 print('Please load a file first.')
         # EXPORT
@@ -840,6 +4218,7 @@ def handle_choices(choice, state):
                 user_input = input(
                     'Do you want a comprehensive report?\n'
                     '1. Comprehensive\n2. Normal\n'
+                    '3. Binary (to draw the charts again later)\n'
                 )
                 if user_input == '1' or user_input.lower() == 'comprehensive':
                     clear_terminal()
@@ -849,13 +4228,15 @@ def handle_choices(choice, state):
                     )
                     if user_input == '2' or user_input.lower() == 'text':
                         export_statistics(
-                            state['current_file'], comprehensive=True
+                            state['current_file'], comprehensive=True,
+                            state=state
                         )
                     elif user_input == '1' or user_input.lower() == 'json':
                         export_statistics(
                             state['current_file'],
                             comprehensive=True,
-                            json_export=True
+                            json_export=True,
+                            state=state
                         )
                     else:
                         print('Please enter a valid choice.')
@@ -866,18 +4247,161 @@ def handle_choices(choice, state):
                         '1. JSON\n2. Text\n'
                     )
                     if user_input == '2' or user_input.lower() == 'text':
-                        export_statistics(state['current_file'])
+                        export_statistics(state['current_file'], state=state)
                     elif user_input == '1' or user_input.lower() == 'json':
                         export_statistics(
-                            state['current_file'], json_export=True
+                            state['current_file'], json_export=True,
+                            state=state
                         )
                     else:
                         print('Please enter a valid choice.')
+                elif user_input == '3' or user_input.lower() == 'binary':
+                    clear_terminal()
+                    export_statistics(
+                        state['current_file'], binary_export=True,
+                        state=state
+                    )
                 else:
                     print('Please enter a valid choice.')
 
             else:
                 print('Please load a file first.')
+        # CLEAR CACHE
+        case '7':
+            clear_terminal()
+            clear_analysis_cache(state)
+            print('Analysis cache cleared.')
+        # CORPUS
+        case '8':
+            clear_terminal()
+            user_input = input(
+                'Input a directory or a pattern like books/*.txt '
+                '(Write \'x\' to cancel): '
+            )
+            if user_input != '' and user_input.lower() != 'x':
+                export_corpus(user_input, state)
+        # SEARCH WORD IN CONTEXT
+        case '9':
+            if not state.get('current_file'):
+                print('Please load a file first.')
+            elif state['current_file'].endswith(BINARY_EXTENSION):
+                print('Exported results can not be searched.')
+            else:
+                clear_terminal()
+                user_input = input('Search for word: ')
+                try:
+                    started = time.perf_counter()
+                    concordance = search_word(
+                        state['current_file'], user_input, state=state
+                    )
+                    elapsed = time.perf_counter() - started
+                except Exception as e:
+                    print(f'Error searching file: {e}')
+                else:
+                    print_concordance(concordance[:KWIC_MENU_LIMIT])
+                    if len(concordance) > KWIC_MENU_LIMIT:
+                        print(
+                            f'... {len(concordance) - KWIC_MENU_LIMIT} '
+                            'more'
+                        )
+                    print(
+                        f'\n{len(concordance)} occurrences found in '
+                        f'{round(elapsed * 1000, 1)} ms'
+                    )
+        # N-GRAM ANALYSIS
+        case '10':
+            if state.get('current_file'):
+                clear_terminal()
+                # Exported results only have the n-grams they were
+                # exported with
+                if not state['current_file'].endswith(BINARY_EXTENSION):
+                    user_input = input('Words per n-gram (Default 2): ')
+                    ngram_size = 2
+                    if user_input.isdigit() and int(user_input) > 0:
+                        ngram_size = int(user_input)
+                    user_input = input(
+                        'Leave out n-grams with common words like "the"? '
+                        '(y/n): '
+                    )
+                    # Kept in the options so exports include the n-grams
+                    options = dict(state.get('options', {}))
+                    options['ngram_size'] = ngram_size
+                    options.pop('ngram_stopwords', None)
+                    if user_input.lower() == 'y':
+                        options['ngram_stopwords'] = True
+                    state['options'] = options
+                # The token stream is decoded with the detected encoding,
+                # other encodings need the text analysed again
+                options = state.get('options', {})
+                if (
+                    state['current_file'].endswith(BINARY_EXTENSION)
+                    or options.get('encoding') is not None
+                    or options.get('encoding_errors') is not None
+                ):
+                    results = get_analysis(state['current_file'], state)
+                else:
+                    try:
+                        results = analyse_token_ngrams(
+                            state['current_file'], options, state
+                        )
+                        results['error'] = None
+                    except (OSError, ValueError) as e:
+                        print(f'Error reading file: {e}')
+                        results = {'error': str(e)}
+                if 'ngram_analysis' in results:
+                    draw_charts(get_ngram_charts(
+                        results, state['current_file']
+                    ))
+                elif results['error'] is None:
+                    print('These results have no n-gram analysis.')
+            else:
+                print('Please load a file first.')
+        # READABILITY PROFILE
+        case '11':
+            if state.get('current_file'):
+                clear_terminal()
+                # Exported results only have the profile they were
+                # exported with
+                if not state['current_file'].endswith(BINARY_EXTENSION):
+                    user_input = input(
+                        'Readability per\n1. Words\n2. Sentences\n'
+                        '3. Chapter\n'
+                    )
+                    unit = 'words'
+                    if user_input == '2' or user_input.lower() == 'sentences':
+                        unit = 'sentences'
+                    elif user_input == '3' or user_input.lower() == 'chapter':
+                        unit = 'chapters'
+                    window = None
+                    if unit != 'chapters':
+                        user_input = input(
+                            f'{unit.capitalize()} per window (Default '
+                            f'{READABILITY_WINDOWS[unit]}): '
+                        )
+                        if user_input.isdigit() and int(user_input) > 0:
+                            window = int(user_input)
+                    # Kept in the options so exports include the profile
+                    options = dict(state.get('options', {}))
+                    options['readability_unit'] = unit
+                    options.pop('readability_window', None)
+                    if window is not None:
+                        options['readability_window'] = window
+                    state['options'] = options
+                results = get_analysis(state['current_file'], state)
+                if 'readability_profile' in results:
+                    profile = results['readability_profile']
+                    print(
+                        f"{len(profile['lix'])} windows, LIX from "
+                        f"{min(profile['lix'], default=0)} to "
+                        f"{max(profile['lix'], default=0)}"
+                    )
+                    draw_charts(get_readability_charts(
+                        results, state['current_file']
+                    ))
+                elif results['error'] is None:
+                    print('These results have no readability profile.')
+            else:
+                print('Please load a file first.')
         case 'x':
             return state, True  # Exit program loop
         case _:
@@ -893,6 +4417,11 @@ def print_menu(state):
     # Display sentence analysis (with visualisation)
     # Display character analysis (with visualisation)
     # Export results
+    # Clear cached analysis results
+    # Analyse a corpus of files
+    # Search a word in context
+    # Show the most common n-grams (with visualisation)
+    # Show the readability profile (with visualisation)
     # Exit programme
     print('--------------------------------')
     print('1. Load a text file')
@@ -901,6 +4430,11 @@ def print_menu(state):
     print('4. Display sentence analysis')
     print('5. Display character analysis')
     print('6. Export results')
+    print('7. Clear analysis cache')
+    print('8. Analyse a corpus (directory or pattern)')
+    print('9. Search word in context')
+    print('10. Display n-gram analysis')
+    print('11. Display readability profile')
     print('x. Exit programme')
     print('--------------------------------')
     if state.get('current_file'):
@@ -912,11 +4446,306 @@ def print_menu(state):
     return user_input  # Returns user choice
 
 
-state = {}
-exit_boolean = False
-while not exit_boolean:  # Program loop
-    user_choice = print_menu(state)
-    state, exit_boolean = handle_choices(user_choice, state)
+# Options of the command line interface that are passed on as analysis
+# options, see analyse_file
+CLI_ANALYSIS_OPTIONS = (
+    'top_words', 'top_letters', 'approximate_top_words',
+    'hyperloglog_precision', 'ngram_size', 'top_ngrams', 'ngram_capacity',
+    'readability_unit', 'readability_window', 'chapter_pattern', 'encoding',
+    'encoding_errors'
+)
+
+
+# Analyse a file without the menu and write a text or JSON report to stdout
+# or a file, for scripts and cron jobs. Messages printed while analysing go
+# to stderr so they never end up in the report. Returns the exit status
+def run_cli(arguments):
+    parser = argparse.ArgumentParser(
+        description='Analyse a text file and write a report. Starts the '
+        'interactive menu when no arguments are given.'
+    )
+    parser.add_argument(
+        'file', nargs='?', help='text file to analyse, or with --corpus a '
+        'directory or glob pattern of files'
+    )
+    parser.add_argument(
+        '-f', '--format', choices=['text', 'json', 'binary'],
+        default='text',
+        help='report format, binary is the compact results format that '
+        f'can be loaded again as FILE when it ends with {BINARY_EXTENSION} '
+        '(default: text)'
+    )
+    parser.add_argument(
+        '--json-style', choices=JSON_STYLES, default='indent',
+        help='indented JSON, compact JSON without whitespace or ndjson with '
+        'one line per section (default: indent)'
+    )
+    parser.add_argument(
+        '-o', '--output', help='write the report to this file instead of '
+        'stdout'
+    )
+    parser.add_argument(
+        '--corpus', action='store_true',
+        help='analyse every file of a directory or glob pattern and write '
+        'one JSON line per file and a summary line (the default for '
+        'directories)'
+    )
+    parser.add_argument(
+        '--charts', metavar='DIRECTORY',
+        help='save every chart of the file or corpus as an image in '
+        'DIRECTORY instead of writing a report, drawn in worker processes '
+        'without a display'
+    )
+    parser.add_argument(
+        '--chart-format', choices=CHART_FORMATS, default='png',
+        help='image format of --charts (default: png)'
+    )
+    parser.add_argument(
+        '-c', '--comprehensive', action='store_true',
+        help='include length lists, sentences and unique words'
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=os.cpu_count() or 1,
+        help='processes used for large files (default: all cores)'
+    )
+    parser.add_argument(
+        '--serve', metavar='SOCKET',
+        help='run as an analysis service on this Unix socket instead of '
+        'analysing FILE, requests are JSON lines like {"path": FILE} or '
+        '{"text": TEXT}'
+    )
+    parser.add_argument(
+        '--port', type=int,
+        help='run as an analysis service over HTTP on this port of '
+        'localhost'
+    )
+    parser.add_argument(
+        '--max-pending', type=int, metavar='REQUESTS',
+        help='requests the service analyses or queues at a time before it '
+        'stops reading new ones (default: '
+        f'{SERVICE_MAX_PENDING_PER_WORKER} per worker)'
+    )
+    parser.add_argument(
+        '--profile', action='store_true',
+        help='print the time, counts and peak memory of every stage to '
+        'stderr and add them to JSON reports as timings (also switched on '
+        'by TEXT_ANALYSIS_PROFILE=1)'
+    )
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='always analyse the whole file, without the analysis cache'
+    )
+    parser.add_argument(
+        '--streaming', action='store_true',
+        help='keep length histograms instead of lists, constant memory'
+    )
+    parser.add_argument(
+        '--top-words', type=int, help='amount of most common words'
+    )
+    parser.add_argument(
+        '--top-letters', type=int, help='amount of most common letters'
+    )
+    parser.add_argument(
+        '--approximate-top-words', type=int, metavar='CAPACITY',
+        help='estimate the most common words counting at most about '
+        'CAPACITY different words'
+    )
+    parser.add_argument(
+        '--hyperloglog-precision', type=int, metavar='PRECISION',
+        help='estimate the amount of unique words (4 to 16), the most '
+        'common words are then estimated too'
+    )
+    parser.add_argument(
+        '--ngrams', type=int, dest='ngram_size', metavar='N',
+        help='also count the most common runs of N words'
+    )
+    parser.add_argument(
+        '--top-ngrams', type=int, help='amount of most common n-grams'
+    )
+    parser.add_argument(
+        '--ngram-capacity', type=int, metavar='CAPACITY',
+        help='count at most about CAPACITY different n-grams (default: '
+        f'{NGRAM_CAPACITY})'
+    )
+    parser.add_argument(
+        '--readability-unit', choices=READABILITY_UNITS,
+        help='also make a readability profile (LIX, average sentence '
+        'length and long words) per window of words or sentences or per '
+        'chapter (default: words when --readability-window is given)'
+    )
+    parser.add_argument(
+        '--readability-window', type=int, metavar='N',
+        help='words or sentences per window of the readability profile '
+        f'(default: {READABILITY_WINDOWS["words"]} words, '
+        f'{READABILITY_WINDOWS["sentences"]} sentences)'
+    )
+    parser.add_argument(
+        '--chapter-pattern', metavar='REGEX',
+        help='regular expression of chapter headings for --readability-unit '
+        'chapters'
+    )
+    parser.add_argument(
+        '--encoding', help='encoding of the file (default: detected, ASCII, '
+        f'UTF-8 or {SINGLE_BYTE_ENCODING})'
+    )
+    parser.add_argument(
+        '--encoding-errors', choices=ENCODING_ERRORS,
+        help='replace or skip bytes that can\'t be decoded and count them, '
+        'or stop with an error (default: replace)'
+    )
+    parser.add_argument(
+        '--ngram-stopwords', nargs='?', const=True, metavar='FILE',
+        help='leave out n-grams with common English words, or with the '
+        'words of FILE'
+    )
+    args = parser.parse_args(arguments)
+    if args.profile:
+        enable_profiling()
+
+    options = {}
+    if args.streaming:
+        options['streaming'] = True
+    for key in CLI_ANALYSIS_OPTIONS:
+        if getattr(args, key) is not None:
+            options[key] = getattr(args, key)
+    if args.encoding is not None:
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError:
+            parser.error(f'Unknown encoding: {args.encoding}')
+    if args.ngram_stopwords is True:
+        options['ngram_stopwords'] = True
+    elif args.ngram_stopwords is not None:
+        try:
+            with open(args.ngram_stopwords, encoding='utf-8') as file_stream:
+                options['ngram_stopwords'] = tuple(
+                    sorted(set(tokenize(file_stream.read())))
+                )
+        except OSError as e:
+            parser.error(f'Could not read stopwords: {e}')
+
+    if args.serve is not None or args.port is not None:
+        import asyncio
+
+        try:
+            asyncio.run(run_service(
+                args.serve, args.port, max(args.workers, 1),
+                args.max_pending, options
+            ))
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            print(f'Error starting service: {e}', file=sys.stderr)
+            return 1
+        return 0
+    if args.file is None:
+        parser.error('the following arguments are required: file')
+    if args.charts is not None:
+        return run_cli_charts(args, options)
+    if args.corpus or os.path.isdir(args.file):
+        return run_cli_corpus(args, options)
+
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            results = get_analysis(
+                args.file, use_cache=not args.no_cache,
+                workers=max(args.workers, 1), options=options
+            )
+    except ValueError as e:
+        parser.error(str(e))
+    # The error has already been printed
+    if results['error'] is not None:
+        return 1
+
+    started = time.perf_counter()
+    try:
+        if args.format == 'binary':
+            if args.output is None:
+                output = contextlib.nullcontext(sys.stdout.buffer)
+            else:
+                output = open(args.output, 'wb')
+        elif args.output is None:
+            output = contextlib.nullcontext(sys.stdout)
+        else:
+            output = open(args.output, 'w', encoding='utf-8')
+        with output as file_stream:
+            if args.format == 'binary':
+                write_binary_results(file_stream, results)
+            elif args.format == 'json':
+                write_json_report(
+                    file_stream, results, args.comprehensive, args.json_style
+                )
+                if args.json_style != 'ndjson':
+                    file_stream.write('\n')
+            else:
+                write_text_report(file_stream, results, args.comprehensive)
+    except Exception as e:
+        print(f'Error writing report: {e}', file=sys.stderr)
+        return 1
+    if 'timings' in results:
+        add_to_profile(results['timings'], 'write_report', started)
+        print_profile(results['timings'], sys.stderr)
+    return 0
+
+
+# Corpus mode of the command line interface, always writes JSON lines.
+# Files that fail are reported and skipped, the exit status is 1 if any did
+def run_cli_corpus(args, options):
+    try:
+        if args.output is None:
+            output = contextlib.nullcontext(sys.stdout)
+        else:
+            output = open(args.output, 'w', encoding='utf-8')
+        with output as file_stream:
+            summary = analyse_corpus(
+                args.file, file_stream, max(args.workers, 1), options,
+                args.comprehensive
+            )
+    except Exception as e:
+        print(f'Error writing report: {e}', file=sys.stderr)
+        return 1
+    if len(summary['failed_files']) != 0:
+        return 1
+    return 0
+
+
+# Chart mode of the command line interface, saves the charts of a file or
+# corpus as images. The exit status is 1 if any file or chart failed
+def run_cli_charts(args, options):
+    if args.corpus or os.path.isdir(args.file):
+        files = find_corpus_files(args.file)
+        if len(files) == 0:
+            print(f'No files found matching {args.file}', file=sys.stderr)
+    else:
+        files = [args.file]
+    try:
+        images, failed_files = render_charts(
+            files, args.charts, args.chart_format, max(args.workers, 1),
+            options
+        )
+    except Exception as e:
+        print(f'Error saving charts: {e}', file=sys.stderr)
+        return 1
+    print(f'{len(images)} charts saved in {args.charts}', file=sys.stderr)
+    if len(failed_files) != 0 or len(images) == 0:
+        return 1
+    return 0
+
+
+# Only start the menu when run as a program, worker processes of the parallel
+# analysis import this file
+if __name__ == '__main__':
+    # Analyse without the menu when arguments are given:
+    # python main.py FILE [--format json] [--output FILE] ...
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
+    # Use all cores for large files
+    state = {'workers': os.cpu_count() or 1}
+    exit_boolean = False
+    while not exit_boolean:  # Program loop
+        user_choice = print_menu(state)
+        state, exit_boolean = handle_choices(user_choice, state)
 
 
 # Dictionaries for counting words
@@ -0,0 +1,330 @@
+import os
+import pytest
+import main
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'CACHE_DIR', str(tmp_path / 'cache'))
+
+
+# A file without a newline has no resume point inside it, it is analysed as
+# the unfinished last line
+def test_cached_analysis_of_file_without_newline(tmp_path):
+    file = tmp_path / 'text.txt'
+    file.write_text('Hello world. This is a test. Another one here.')
+    uncached = main.get_analysis(str(file), use_cache=False)
+    cached = main.get_analysis(str(file))
+    assert cached['sentence_analysis']['only_lengths'].tolist() == [2, 4, 3]
+    assert cached['lix'] == uncached['lix'] == 14.1
+
+    # Resuming from the start once a newline is added
+    file.write_text('Hello world. This is a test.\nAnother one here.')
+    assert main.get_analysis(str(file), state={})['sentence_analysis'][
+        'only_lengths'
+    ].tolist() == [2, 4, 3]
+
+
+# Edits between the sampled parts of the file fingerprint are noticed when
+# resuming an analysis
+def test_resume_point_notices_edits(tmp_path):
+    file = tmp_path / 'text.txt'
+    lines = [
+        f'Line number {i} has some words in it.\n' for i in range(20000)
+    ]
+    file.write_text(''.join(lines))
+    results, resume_point = main.analyse_file_incremental(str(file))
+    # Same size, outside the sampled start, middle and end
+    lines[3000] = lines[3000].replace('words', 'wordz')
+    file.write_text(''.join(lines))
+    results, resume_point = main.analyse_file_incremental(
+        str(file), resume_point=resume_point
+    )
+    assert results == main.analyse_file(str(file))
+
+    # Appended lines are analysed from the resume point
+    with open(file, 'a') as file_stream:
+        file_stream.write('One more line. And another one.\n')
+    results, resume_point = main.analyse_file_incremental(
+        str(file), resume_point=resume_point
+    )
+    assert results == main.analyse_file(str(file))
+
+
+# Searching after a cancelled load asks for a file instead of failing
+def test_search_without_file(capsys):
+    main.handle_choices('9', {'current_file': None})
+    assert 'Please load a file first.' in capsys.readouterr().out
+
+
+# Token streams count toward the cache size and are evicted like results
+def test_token_streams_are_evicted(tmp_path):
+    file = tmp_path / 'text.txt'
+    file.write_text('Some words in a sentence. And some more words.\n')
+    main.analyse_token_ngrams(str(file), {'ngram_size': 2})
+    tokens_path = main.get_tokens_path(str(file))
+    assert os.path.exists(tokens_path)
+    main.evict_cached_analyses(max_bytes=0)
+    assert not os.path.exists(tokens_path)
+
+
+# N-grams counted from the token stream are the same as from the text
+def test_token_ngrams_match_analysis():
+    for options in (
+        {'ngram_size': 2},
+        {'ngram_size': 3, 'ngram_stopwords': True, 'top_ngrams': 5}
+    ):
+        results = main.analyse_token_ngrams('crime.txt', options)
+        assert results['ngram_analysis'] == main.analyse_file(
+            'crime.txt', 1, options
+        )['ngram_analysis']
+
+
+# Words of single-byte encoded files are found like the analysis counts them
+def test_search_cp1252_file(tmp_path):
+    file = tmp_path / 'text.txt'
+    file.write_bytes(
+        'Café au lait. Le café est bon.\nUn café noir.\n'
+        .encode('cp1252')
+    )
+    results = main.analyse_file(str(file))
+    assert results['word_analysis'][1]['Café'] == 3
+    concordance = main.search_word(str(file), 'café')
+    assert len(concordance) == 3
+    assert concordance[0]['keyword'] == 'Café'
+
+
+# With a HyperLogLog estimate the vocabulary isn't kept, so no exact counts
+# are reported next to the estimate
+def test_hyperloglog_without_vocabulary():
+    results = main.analyse_file('iliad.txt', 1, {'hyperloglog_precision': 12})
+    statistics, top_words, unique_words = results['word_analysis']
+    assert 'unique_words_estimate' in statistics
+    assert 'unique_words_count' not in statistics
+    assert statistics['words_only_once_count'] is None
+    assert unique_words == set()
+    assert len(top_words) == 10
+
+
+# The analysis saves the words of the file as a token stream, so n-grams
+# can be counted from it without analysing the file again
+def test_analysis_saves_token_stream(tmp_path, monkeypatch):
+    file = tmp_path / 'text.txt'
+    file.write_text('Some words in a sentence. And some more words.\n')
+    main.get_analysis(str(file))
+    assert os.path.exists(main.get_tokens_path(str(file)))
+    expected = main.analyse_file(str(file), 1, {'ngram_size': 2})
+
+    def analyse_file_part(*args):
+        raise AssertionError('The file is analysed again')
+    monkeypatch.setattr(main, 'analyse_file_part', analyse_file_part)
+    results = main.analyse_token_ngrams(str(file), {'ngram_size': 2})
+    assert results['ngram_analysis'] == expected['ngram_analysis']
+
+
+# Corpus lines are made in the workers and have the report of each file
+def test_corpus_lines(tmp_path):
+    import io
+    import json
+    for name in ('a.txt', 'b.txt'):
+        (tmp_path / name).write_text(f'The file {name} has words. Yes.\n')
+    file_stream = io.StringIO()
+    summary = main.analyse_corpus(str(tmp_path), file_stream, 2)
+    lines = [json.loads(line) for line in file_stream.getvalue().splitlines()]
+    assert sorted(line.get('file') for line in lines[:2]) == [
+        str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')
+    ]
+    for line in lines[:2]:
+        assert line['error'] is None
+        assert line['report'] == json.loads(json.dumps(
+            main.get_json_report(main.analyse_file(line['file'])),
+            default=main.json_default
+        ))
+    assert lines[2] == {'corpus_summary': summary}
+    assert summary['files'] == 2
+
+
+# Answers of the service have the report made in the worker, and reports of
+# files are kept in memory by options and comprehensive
+def test_service_answers(tmp_path):
+    import asyncio
+    import json
+    file = tmp_path / 'text.txt'
+    file.write_text('Some words in a sentence. And some more words.\n')
+
+    async def answer(service, request):
+        return json.loads(await main.answer_service_request(
+            service, json.dumps(request)
+        ))
+
+    async def run():
+        service = main.new_service(1)
+        try:
+            for comprehensive in (False, True, True):
+                assert await answer(service, {
+                    'id': 1, 'path': str(file),
+                    'comprehensive': comprehensive
+                }) == {
+                    'id': 1, 'error': None,
+                    'report': json.loads(json.dumps(
+                        main.get_json_report(
+                            main.analyse_file(str(file)), comprehensive
+                        ),
+                        default=main.json_default
+                    ))
+                }
+            assert len(service['report_cache']) == 2
+            assert service['report_cache_bytes'] == sum(
+                len(report) for _, report in service['report_cache'].values()
+            )
+            assert (await answer(service, {'id': 'x', 'text': 'Hi.'}))[
+                'report'
+            ]['basic_statistics']['total_words'] == 1
+            assert await answer(service, {'id': 2}) == {
+                'id': 2, 'error': 'A request needs a path or text'
+            }
+        finally:
+            service['executor'].shutdown()
+
+    asyncio.run(run())
+
+
+# The lines of every word in the index are the lines the word is on
+def test_index_lines():
+    expected = {}
+    offset = 0
+    with open('crime.txt', 'rb') as file_stream:
+        for line_number, line in enumerate(file_stream):
+            for word in set(main.tokenize(line.decode('utf-8', 'replace'))):
+                expected.setdefault(word, []).append((line_number, offset))
+            offset += len(line)
+    header = main.get_index('crime.txt')
+    assert header['words'].keys() == expected.keys()
+    for word in ('the', 'raskolnikov', 'axe'):
+        assert main.find_word_lines('crime.txt', word) == expected[word]
+        assert header['words'][word][2] == len(expected[word])
+
+
+# Chunks analysed in parallel and merged give the same results as one pass,
+# also when the chunks start in the middle of sentences
+@pytest.mark.parametrize('workers', [2, 5, 13])
+def test_parallel_matches_serial(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(main, 'PARALLEL_MIN_SIZE', 0)
+    monkeypatch.setattr(main, 'CHUNK_SEARCH_SIZE', 16)
+    # Sentences over many lines, so most chunk edges are in a sentence, and
+    # one sentence longer than a chunk
+    file = tmp_path / 'text.txt'
+    file.write_text(
+        ''.join(
+            f'Line {i} of a sentence that goes\non and {"on. " * (i % 3)}'
+            f'Åsa såg {i} öar!\n'
+            for i in range(300)
+        )
+        + 'and on\n' * 3000 + 'until the end.\n'
+    )
+    for path in (str(file), 'syndaflod.txt'):
+        for options in (
+            None,
+            {'ngram_size': 2, 'top_ngrams': 5},
+            {'readability_unit': 'words', 'ngram_size': 3}
+        ):
+            serial = main.analyse_file(path, 1, options)
+            parallel = main.analyse_file(path, workers, options)
+            assert len(main.split_file(path, workers)) > 1
+            assert parallel.keys() == serial.keys()
+            for key in serial:
+                assert parallel[key] == serial[key], key
+
+
+# Character analysis counted in bulk matches classifying every character
+# one at a time, with and without NumPy
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_character_analysis(tmp_path, monkeypatch, use_numpy):
+    if use_numpy:
+        if main.load_numpy() is None:
+            pytest.skip('NumPy is not installed')
+        monkeypatch.setattr(main, 'NUMPY_MIN_SIZE', 0)
+    else:
+        monkeypatch.setattr(main, 'numpy', None)
+    file = tmp_path / 'text.txt'
+    file.write_text('Ωμέγα 3 “quotes” — Ünïcödé! Ok? 100% & done.\n' * 50)
+
+    for path in ('syndaflod.txt', 'crime.txt', str(file)):
+        letter_counts = {}
+        punctuation_counts = {}
+        totals = {'upper': 0, 'lower': 0, 'digits': 0, 'spaces': 0}
+        total_chars = 0
+        for text in main.read_text_blocks(path):
+            for char in text:
+                total_chars += 1
+                if char.isalpha():
+                    letter_counts.setdefault(char.lower(), 0)
+                    letter_counts[char.lower()] += 1
+                    if char.isupper():
+                        totals['upper'] += 1
+                    else:
+                        totals['lower'] += 1
+                elif char.isdigit():
+                    totals['digits'] += 1
+                elif char.isspace():
+                    totals['spaces'] += 1
+                elif char in '.?!':
+                    punctuation_counts.setdefault(char, 0)
+                    punctuation_counts[char] += 1
+
+        statistics, top_letters = main.analyse_file(path)[
+            'character_analysis'
+        ]
+        # Same order too, it decides ties in the top letters
+        assert list(statistics['letter_counts'].items()) == list(
+            letter_counts.items()
+        )
+        assert list(statistics['punctuation_counts'].items()) == list(
+            punctuation_counts.items()
+        )
+        assert statistics['total_upper'] == totals['upper']
+        assert statistics['total_lower'] == totals['lower']
+        assert statistics['total_digits'] == totals['digits']
+        assert statistics['total_spaces'] == totals['spaces']
+        assert statistics['total_chars'] == total_chars
+        assert top_letters == main.top_k(letter_counts, 12)
+    assert {'å', 'ä', 'ö'} <= main.analyse_file('syndaflod.txt')[
+        'character_analysis'
+    ][0]['letter_counts'].keys()
+
+
+# Sentences found with the pattern over whole blocks are the sentences of
+# reading one character at a time, with the same 2 word minimum
+@pytest.mark.parametrize('read_size', [main.READ_SIZE, 100])
+def test_sentence_segmentation(tmp_path, monkeypatch, read_size):
+    # Small blocks put sentences across blocks
+    monkeypatch.setattr(main, 'READ_SIZE', read_size)
+    file = tmp_path / 'text.txt'
+    file.write_text(
+        'One. Two words. ...Three words here?! A\nsentence over lines!'
+        ' No end'
+    )
+    for path in ('test.txt', 'syndaflod.txt', 'crime.txt', str(file)):
+        sentences = []
+        current_sentence = ''
+        for text in main.read_text_blocks(path):
+            for char in text:
+                current_sentence += char
+                if char in '.?!':
+                    sentence = current_sentence.strip()
+                    if len(sentence.split()) >= 2:
+                        sentences.append(sentence)
+                    current_sentence = ''
+
+        statistics = main.sentence_analysis(path, use_cache=False)
+        assert statistics['sentence_lengths'] == [
+            (len(sentence.split()), sentence.split())
+            for sentence in sentences
+        ]
+        assert statistics['only_lengths'] == [
+            len(sentence.split()) for sentence in sentences
+        ]
+        assert list(main.read_sentences(path)) == sentences
+    assert sentences == [
+        'Two words.', 'Three words here?', 'A\nsentence over lines!'
+    ]